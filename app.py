@@ -1,17 +1,53 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, g, stream_with_context
 from scraper import OfertasScraper
 import re
 import os
 import json
+import math
+import atexit
+import contextvars
+import gzip
+import hashlib
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import urljoin
-from datetime import date
+from datetime import date, datetime, timezone
+from price_alerts import create_alert_index
 from price_history import create_history_service, product_fingerprint
+from result_cache import ResultCache
+from metrics import metrics
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin el se comprime solo con gzip.
+    brotli = None
 
 app = Flask(__name__)
 scraper = OfertasScraper()
-history_service = create_history_service()
+atexit.register(scraper.cerrar)
+# En modo http Chrome es solo el ultimo recurso: no se precalienta por defecto.
+_warmup_default = '1' if scraper.preciosgamer_modo == 'selenium' else '0'
+if os.getenv('SELENIUM_POOL_WARMUP', _warmup_default).strip().lower() not in ('0', 'false', 'no'):
+    scraper.precalentar_drivers()
+alert_index = create_alert_index()
+history_service = create_history_service(alerts=alert_index)
+atexit.register(history_service.close)
 CACHE_FILE = os.getenv('PRECIOSGAMER_CACHE_FILE', 'data/preciosgamer_cache.json')
 CACHE_MAX_AGE_HOURS = int(os.getenv('PRECIOSGAMER_CACHE_MAX_AGE_HOURS', '72'))
+HARDGAMERS_PAGINAS_MAX = int(os.getenv('HARDGAMERS_PAGINAS_MAX', '10'))
+BUSQUEDA_LOTE_MAX = int(os.getenv('BUSQUEDA_LOTE_MAX', '20'))
+BUSQUEDA_LOTE_TIMEOUT = float(os.getenv('BUSQUEDA_LOTE_TIMEOUT', '60'))
+# Cada busqueda del lote lanza sus fuentes en el pool del scraper, con el
+# deadline propio de cada una; por defecto el lote no usa mas busquedas
+# simultaneas que las que ese pool tiene previstas.
+lote_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BUSQUEDA_LOTE_WORKERS', str(scraper.busquedas_simultaneas))),
+    thread_name_prefix='lote',
+)
+RESPUESTA_COMPRESION_MIN = int(os.getenv('RESPUESTA_COMPRESION_MIN', '1024'))
+SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', '0').strip().lower() in ('1', 'true', 'yes')
 
 
 def get_base_url():
@@ -30,39 +66,77 @@ def normalizar_query_cache(query):
     return query.strip()
 
 
+cache_busquedas = ResultCache(
+    key_fn=normalizar_query_cache,
+    ttls={
+        'preciosgamer': float(os.getenv('BUSQUEDA_CACHE_TTL_PRECIOSGAMER', '600')),
+        'hardgamers': float(os.getenv('BUSQUEDA_CACHE_TTL_HARDGAMERS', '300')),
+    },
+    negative_ttl=float(os.getenv('BUSQUEDA_CACHE_TTL_VACIO', '60')),
+    stale_ttl=float(os.getenv('BUSQUEDA_CACHE_STALE', '1800')),
+    max_entries=int(os.getenv('BUSQUEDA_CACHE_MAX_ENTRIES', '256')),
+)
+
+
+_cache_preciosgamer = {'firma': None, 'queries': {}}
+_cache_preciosgamer_lock = threading.Lock()
+
+
+def _parsear_fecha_cache(valor):
+    # formato esperado: YYYY-MM-DDTHH:MM:SSZ
+    try:
+        return datetime.strptime(valor, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
 def cargar_cache_preciosgamer():
-    if not os.path.exists(CACHE_FILE):
-        return {}
+    """Devuelve {query normalizada: (fecha, resultados)} desde memoria.
+
+    El archivo se parsea una sola vez y se vuelve a leer solo si cambian su
+    mtime o tamano; las fechas quedan parseadas.
+    """
     try:
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception:
+        stat = os.stat(CACHE_FILE)
+    except OSError:
         return {}
+    firma = (stat.st_mtime_ns, stat.st_size)
+
+    with _cache_preciosgamer_lock:
+        if _cache_preciosgamer['firma'] != firma:
+            try:
+                with open(CACHE_FILE, 'r', encoding='utf-8-sig') as f:
+                    data = json.load(f)
+            except Exception:
+                data = {}
+            queries = {}
+            for key, entry in (data.get('queries') or {}).items():
+                queries[normalizar_query_cache(key)] = (
+                    _parsear_fecha_cache(entry.get('updated_at')),
+                    entry.get('results', []),
+                )
+            _cache_preciosgamer['firma'] = firma
+            _cache_preciosgamer['queries'] = queries
+        return _cache_preciosgamer['queries']
 
 
 def obtener_cache_preciosgamer(query):
-    cache = cargar_cache_preciosgamer()
-    key = normalizar_query_cache(query)
-    entry = cache.get('queries', {}).get(key)
-    if not entry:
-        return []
-
-    updated_at = entry.get('updated_at')
-    if not updated_at:
-        return entry.get('results', [])
-
-    try:
-        # formato esperado: YYYY-MM-DDTHH:MM:SSZ
-        from datetime import datetime, timezone
-        ts = datetime.strptime(updated_at, '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
-        now = datetime.now(timezone.utc)
-        age_hours = (now - ts).total_seconds() / 3600
-        if age_hours > CACHE_MAX_AGE_HOURS:
+    with metrics.span('cache_fallback', fuente='preciosgamer') as span:
+        entry = cargar_cache_preciosgamer().get(normalizar_query_cache(query))
+        if not entry:
+            span['resultado'] = 'miss'
             return []
-    except Exception:
-        pass
 
-    return entry.get('results', [])
+        ts, results = entry
+        if ts is not None:
+            age_hours = (datetime.now(timezone.utc) - ts).total_seconds() / 3600
+            if age_hours > CACHE_MAX_AGE_HOURS:
+                span['resultado'] = 'vencido'
+                return []
+
+        span['resultado'] = 'hit'
+        # Copias: los items se completan despues con price_change y demas.
+        return [dict(item) for item in results]
 
 def normalizar_texto(texto):
     """Normaliza un texto para comparación: lowercase, sin espacios extra, sin caracteres especiales"""
@@ -125,41 +199,84 @@ def son_duplicados(producto1, producto2):
     
     return nombres_similares and tiendas_coinciden and precios_similares
 
+# Dos precios son "similares" si difieren menos de 1%, o sea que su cociente
+# es menor a 1/0.99. Con buckets logaritmicos apenas mas anchos que ese
+# cociente, dos precios similares siempre caen en buckets vecinos.
+ANCHO_BUCKET_PRECIO = math.log(1 / 0.99) * 1.01
+
+
+def calidad_nombre(producto):
+    """Menor es mejor: penaliza repeticiones y prefiere nombres cortos"""
+    nombre = producto.get('nombre', '')
+    # Penalizar nombres con repeticiones como "placa de placa"
+    if 'placa de placa' in nombre.lower():
+        return 1
+    # Preferir nombres más cortos
+    return len(nombre)
+
+
+def precios_similares(precio1, precio2):
+    """Menos del 1% de diferencia, con la misma regla que son_duplicados"""
+    diferencia_precio = abs(precio1 - precio2)
+    maximo = max(precio1, precio2)
+    porcentaje_diferencia = (diferencia_precio / maximo * 100) if maximo > 0 else 0
+    return porcentaje_diferencia < 1.0
+
+
+def bucket_precio(precio):
+    if precio <= 0:
+        return None
+    return math.floor(math.log(precio) / ANCHO_BUCKET_PRECIO)
+
+
 def eliminar_duplicados(resultados):
-    """Elimina productos duplicados de la lista, manteniendo el de mejor formato"""
+    """Elimina productos duplicados de la lista, manteniendo el de mejor formato.
+
+    Da el mismo resultado que comparar cada producto contra todos los ya
+    vistos con `son_duplicados`, pero normaliza cada producto una sola vez y
+    solo calcula Jaccard contra candidatos de la misma tienda, bucket de
+    precio vecino y al menos una palabra en comun (indice invertido).
+    """
     if not resultados:
         return resultados
-    
-    # Ordenar por calidad del nombre (preferir nombres más cortos y sin repeticiones)
-    def calidad_nombre(producto):
-        nombre = producto.get('nombre', '')
-        # Penalizar nombres con repeticiones como "placa de placa"
-        if 'placa de placa' in nombre.lower():
-            return 1
-        # Preferir nombres más cortos
-        return len(nombre)
-    
+
+    # Como se recorre en orden de calidad, un producto posterior nunca tiene
+    # mejor nombre que uno ya visto: basta con descartar los duplicados.
     resultados_ordenados = sorted(resultados, key=calidad_nombre)
     resultados_sin_duplicados = []
-    productos_vistos = []
-    
+    vistos = []  # (cantidad de palabras, precio) por producto conservado
+    indice = defaultdict(list)  # (tienda, bucket, palabra) -> posiciones en vistos
+
     for producto in resultados_ordenados:
+        palabras = set(normalizar_texto(producto.get('nombre', '')).split())
+        tienda = normalizar_tienda(producto.get('tienda', ''))
+        precio = producto.get('precio', 0)
+        bucket = bucket_precio(precio)
+
         es_duplicado = False
-        for visto in productos_vistos:
-            if son_duplicados(producto, visto):
-                es_duplicado = True
-                # Si el nuevo producto tiene mejor nombre, reemplazar
-                if calidad_nombre(producto) < calidad_nombre(visto):
-                    resultados_sin_duplicados.remove(visto)
-                    productos_vistos.remove(visto)
-                    resultados_sin_duplicados.append(producto)
-                    productos_vistos.append(producto)
-                break
-        
+        if palabras:
+            vecinos = (None,) if bucket is None else (bucket - 1, bucket, bucket + 1)
+            comunes = Counter()
+            for vecino in vecinos:
+                for palabra in palabras:
+                    for pos in indice.get((tienda, vecino, palabra), ()):
+                        comunes[pos] += 1
+
+            for pos, palabras_comunes in comunes.items():
+                otras, otro_precio = vistos[pos]
+                palabras_totales = len(palabras) + otras - palabras_comunes
+                similitud = palabras_comunes / palabras_totales * 100
+                if similitud >= 70 and precios_similares(precio, otro_precio):
+                    es_duplicado = True
+                    break
+
         if not es_duplicado:
+            pos = len(vistos)
+            vistos.append((len(palabras), precio))
             resultados_sin_duplicados.append(producto)
-            productos_vistos.append(producto)
-    
+            for palabra in palabras:
+                indice[(tienda, bucket, palabra)].append(pos)
+
     return resultados_sin_duplicados
 
 
@@ -173,6 +290,174 @@ def aplicar_cambios_de_historial(resultados, cambios):
             continue
         producto["price_change"] = cambio
 
+def preparar_fuente(fuente, query, items):
+    """Elimina duplicados de una fuente; si PreciosGamer vino vacia usa la cache en disco"""
+    cache_usado = False
+    if fuente == 'preciosgamer' and not items:
+        cache_pg = obtener_cache_preciosgamer(query)
+        if cache_pg:
+            items = cache_pg
+            cache_usado = True
+    with metrics.span('dedup', fuente=fuente):
+        items = eliminar_duplicados(items)
+    return items, cache_usado
+
+
+def completar_busqueda(query, resultados, cache_usado_preciosgamer):
+    """Combina las fuentes, guarda el snapshot de historial y completa la respuesta"""
+    # Combinar y eliminar duplicados entre fuentes
+    todos_resultados = resultados['preciosgamer'] + resultados['hardgamers']
+    with metrics.span('dedup', fuente='combinado'):
+        todos_resultados = eliminar_duplicados(todos_resultados)
+
+    # Ordenar todos los resultados por precio
+    todos_resultados.sort(key=lambda x: x['precio'] if x['precio'] > 0 else float('inf'))
+
+    snapshot = history_service.record_snapshot(query, todos_resultados)
+    cambios = snapshot.get("changes", {})
+    aplicar_cambios_de_historial(todos_resultados, cambios)
+    aplicar_cambios_de_historial(resultados['preciosgamer'], cambios)
+    aplicar_cambios_de_historial(resultados['hardgamers'], cambios)
+
+    resultados['todos'] = todos_resultados
+    resultados['total'] = len(todos_resultados)
+    resultados['historial'] = {
+        'guardado': snapshot.get('saved', False),
+        'encolado': snapshot.get('queued', False),
+        'backend': snapshot.get('backend'),
+        'capturado_en': snapshot.get('captured_at')
+    }
+    resultados['cache'] = {
+        'preciosgamer_usado': cache_usado_preciosgamer,
+        'memoria': {
+            fuente: estado.get('cache')
+            for fuente, estado in resultados.get('fuentes', {}).items()
+        },
+    }
+    return resultados
+
+
+def opciones_busqueda(data):
+    """Opciones por fuente pedidas en el body; los valores invalidos se ignoran."""
+    hardgamers = {}
+    try:
+        if data.get('hardgamers_paginas') is not None:
+            hardgamers['paginas'] = min(max(1, int(data['hardgamers_paginas'])), HARDGAMERS_PAGINAS_MAX)
+    except (TypeError, ValueError):
+        pass
+    try:
+        if data.get('hardgamers_presupuesto') is not None:
+            presupuesto = float(data['hardgamers_presupuesto'])
+            if math.isfinite(presupuesto):
+                hardgamers['presupuesto'] = min(max(0.5, presupuesto), scraper.timeouts['hardgamers'])
+    except (TypeError, ValueError):
+        pass
+    return {'hardgamers': hardgamers} if hardgamers else None
+
+
+def compactar_productos(listas):
+    """Una sola tabla de productos y, por cada lista, los indices en esa tabla.
+
+    Los productos de `todos` son los mismos objetos que los de cada fuente,
+    asi que se deduplican por identidad. Las columnas salen de las claves
+    vistas, en orden de aparicion.
+    """
+    posiciones = {}
+    productos = []
+    campos = {}
+    indices = {}
+    for nombre, lista in listas.items():
+        indices[nombre] = []
+        for producto in lista:
+            pos = posiciones.get(id(producto))
+            if pos is None:
+                pos = posiciones[id(producto)] = len(productos)
+                productos.append(producto)
+                for campo in producto:
+                    campos.setdefault(campo, None)
+            indices[nombre].append(pos)
+    columnas = list(campos)
+    filas = [[producto.get(campo) for campo in columnas] for producto in productos]
+    return {'campos': columnas, 'filas': filas}, indices
+
+
+# Campos que cambian entre dos busquedas identicas (el historial los anota
+# despues de grabar cada snapshot): no entran en el ETag.
+CAMPOS_VOLATILES = ('price_change',)
+
+
+def sin_volatiles(productos):
+    """Copia de `productos` (tabla compacta o lista de dicts) sin `CAMPOS_VOLATILES`."""
+    if isinstance(productos, dict):
+        conservar = [i for i, campo in enumerate(productos['campos']) if campo not in CAMPOS_VOLATILES]
+        return {
+            'campos': [productos['campos'][i] for i in conservar],
+            'filas': [[fila[i] for i in conservar] for fila in productos['filas']],
+        }
+    return [{k: v for k, v in producto.items() if k not in CAMPOS_VOLATILES} for producto in productos]
+
+
+def respuesta_json(payload, etag_de=None):
+    """JSON con ETag fuerte, 304 ante If-None-Match y compresion negociada.
+
+    El ETag sale de `etag_de` (por defecto, del cuerpo): asi datos volatiles
+    como la fecha de captura no impiden el 304 si los resultados no cambiaron.
+    Cada codificacion tiene su propio ETag, pero cualquiera valida.
+    """
+    cuerpo = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    semilla = cuerpo if etag_de is None else json.dumps(
+        etag_de, ensure_ascii=False, sort_keys=True, separators=(',', ':')
+    ).encode('utf-8')
+    etag = hashlib.sha1(semilla).hexdigest()
+
+    codificaciones = ['br', 'gzip'] if brotli is not None else ['gzip']
+    codificacion = None
+    if len(cuerpo) >= RESPUESTA_COMPRESION_MIN:
+        codificacion = request.accept_encodings.best_match(codificaciones)
+    variante = f'{etag}-{codificacion}' if codificacion else etag
+
+    if any(request.if_none_match.contains(t) for t in (etag, f'{etag}-br', f'{etag}-gzip')):
+        response = Response(status=304)
+    else:
+        if codificacion == 'br':
+            cuerpo = brotli.compress(cuerpo, quality=5)
+        elif codificacion == 'gzip':
+            cuerpo = gzip.compress(cuerpo, compresslevel=6)
+        response = Response(cuerpo, mimetype='application/json')
+        if codificacion:
+            response.headers['Content-Encoding'] = codificacion
+    response.set_etag(variante)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def linea_ndjson(evento):
+    return json.dumps(evento, ensure_ascii=False) + '\n'
+
+
+@app.before_request
+def iniciar_metricas():
+    g.metricas_inicio = time.perf_counter()
+    g.metricas_token = metrics.start_request()
+
+
+@app.after_request
+def cerrar_metricas(response):
+    token = g.pop('metricas_token', None)
+    if token is None:
+        return response
+    metrics.observe(
+        'request',
+        time.perf_counter() - g.metricas_inicio,
+        endpoint=request.endpoint or 'desconocido',
+        status=response.status_code,
+    )
+    timings = metrics.end_request(token)
+    if SERVER_TIMING and timings:
+        response.headers['Server-Timing'] = metrics.server_timing(timings)
+    return response
+
+
 @app.route('/')
 def index():
     base_url = get_base_url()
@@ -227,43 +512,165 @@ def buscar():
         if not query:
             return jsonify({'error': 'La búsqueda no puede estar vacía'}), 400
         
-        resultados = scraper.buscar_todo(query)
+        resultados = scraper.buscar_todo(query, cache=cache_busquedas, opciones=opciones_busqueda(data))
         cache_usado_preciosgamer = False
-        if not resultados.get('preciosgamer'):
-            cache_pg = obtener_cache_preciosgamer(query)
-            if cache_pg:
-                resultados['preciosgamer'] = cache_pg
-                cache_usado_preciosgamer = True
-        
-        # Eliminar duplicados de cada fuente
-        resultados['preciosgamer'] = eliminar_duplicados(resultados['preciosgamer'])
-        resultados['hardgamers'] = eliminar_duplicados(resultados['hardgamers'])
-        
-        # Combinar y eliminar duplicados entre fuentes
-        todos_resultados = resultados['preciosgamer'] + resultados['hardgamers']
-        todos_resultados = eliminar_duplicados(todos_resultados)
-        
-        # Ordenar todos los resultados por precio
-        todos_resultados.sort(key=lambda x: x['precio'] if x['precio'] > 0 else float('inf'))
-
-        snapshot = history_service.record_snapshot(query, todos_resultados)
-        cambios = snapshot.get("changes", {})
-        aplicar_cambios_de_historial(todos_resultados, cambios)
-        aplicar_cambios_de_historial(resultados['preciosgamer'], cambios)
-        aplicar_cambios_de_historial(resultados['hardgamers'], cambios)
-
-        resultados['todos'] = todos_resultados
-        resultados['total'] = len(todos_resultados)
-        resultados['historial'] = {
-            'guardado': snapshot.get('saved', False),
-            'backend': snapshot.get('backend'),
-            'capturado_en': snapshot.get('captured_at')
-        }
-        resultados['cache'] = {
-            'preciosgamer_usado': cache_usado_preciosgamer
+        for fuente in ('preciosgamer', 'hardgamers'):
+            resultados[fuente], cache_usado = preparar_fuente(fuente, query, resultados[fuente])
+            cache_usado_preciosgamer = cache_usado_preciosgamer or cache_usado
+
+        completar_busqueda(query, resultados, cache_usado_preciosgamer)
+
+        # `formato: compacto`: una tabla de productos y listas de indices.
+        formato = request.args.get('formato') or data.get('formato') or 'completo'
+        productos, indices = compactar_productos({
+            fuente: resultados[fuente] for fuente in ('todos', 'preciosgamer', 'hardgamers')
+        })
+        etag_de = {'formato': formato, 'query': query, 'productos': sin_volatiles(productos), **indices}
+        if formato == 'compacto':
+            resultados = {
+                clave: valor for clave, valor in resultados.items()
+                if clave not in ('todos', 'preciosgamer', 'hardgamers')
+            }
+            resultados.update(formato='compacto', productos=productos, **indices)
+        return respuesta_json(resultados, etag_de=etag_de)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/buscar/stream', methods=['POST'])
+def buscar_stream():
+    """Variante de /buscar que emite NDJSON: un evento `fuente` por cada fuente
+    apenas termina, y un evento `final` con el mismo cuerpo que /buscar."""
+    data = request.get_json() or {}
+    query = data.get('query', '').strip()
+    if not query:
+        return jsonify({'error': 'La búsqueda no puede estar vacía'}), 400
+    opciones = opciones_busqueda(data)
+
+    def generar():
+        try:
+            resultados = {
+                'query': query,
+                'preciosgamer': [],
+                'hardgamers': [],
+                'fuentes': {},
+                'total': 0
+            }
+            cache_usado_preciosgamer = False
+            for fuente, items, estado in scraper.iterar_fuentes(query, cache=cache_busquedas, opciones=opciones):
+                items, cache_usado = preparar_fuente(fuente, query, items)
+                cache_usado_preciosgamer = cache_usado_preciosgamer or cache_usado
+                resultados[fuente] = items
+                resultados['fuentes'][fuente] = estado
+                yield linea_ndjson({
+                    'tipo': 'fuente',
+                    'fuente': fuente,
+                    'estado': estado,
+                    'cache_usado': cache_usado,
+                    'items': items,
+                })
+
+            completar_busqueda(query, resultados, cache_usado_preciosgamer)
+            yield linea_ndjson({'tipo': 'final', 'resultados': resultados})
+        except Exception as e:
+            yield linea_ndjson({'tipo': 'error', 'error': str(e)})
+
+    return Response(
+        stream_with_context(generar()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+def buscar_para_lote(query):
+    """Busca una query del lote: una sola pasada de duplicados sobre ambas fuentes"""
+    # Igual que /buscar: una fuente colgada vence con su deadline y no se
+    # come el presupuesto de todo el lote.
+    resultados = scraper.buscar_todo(query, cache=cache_busquedas)
+    preciosgamer = resultados['preciosgamer']
+    cache_usado = False
+    if not preciosgamer:
+        preciosgamer = obtener_cache_preciosgamer(query)
+        cache_usado = bool(preciosgamer)
+    with metrics.span('dedup', fuente='lote'):
+        todos = eliminar_duplicados(preciosgamer + resultados['hardgamers'])
+    todos.sort(key=lambda x: x['precio'] if x['precio'] > 0 else float('inf'))
+    return todos, resultados['fuentes'], cache_usado
+
+
+@app.route('/buscar/lote', methods=['POST'])
+def buscar_lote():
+    """Busca varias queries en paralelo y devuelve las N mas baratas de cada una.
+
+    Body: `{"queries": [...], "limite": 15}`. `resultados[i]` corresponde a
+    `queries[i]`; todo el lote se guarda en el historial con una sola
+    escritura y cada producto trae su `price_change`.
+    """
+    try:
+        data = request.get_json() or {}
+        queries = data.get('queries')
+        if not isinstance(queries, list):
+            return jsonify({'error': 'queries debe ser una lista'}), 400
+        queries = [q.strip() for q in queries if isinstance(q, str) and q.strip()]
+        if not queries:
+            return jsonify({'error': 'La lista de busquedas no puede estar vacia'}), 400
+
+        unicas = {}
+        for query in queries:
+            unicas.setdefault(normalizar_query_cache(query), query)
+        if len(unicas) > BUSQUEDA_LOTE_MAX:
+            return jsonify({'error': f'Maximo {BUSQUEDA_LOTE_MAX} busquedas por lote'}), 400
+        try:
+            limite = min(max(1, int(data.get('limite', 15))), 50)
+        except (TypeError, ValueError):
+            limite = 15
+
+        futuros = {
+            lote_executor.submit(contextvars.copy_context().run, buscar_para_lote, query): clave
+            for clave, query in unicas.items()
         }
-        
-        return jsonify(resultados)
+        hechos, _ = wait(futuros, timeout=BUSQUEDA_LOTE_TIMEOUT)
+
+        por_clave = {}
+        for futuro, clave in futuros.items():
+            if futuro not in hechos:
+                # El hilo sigue y deja su resultado en la cache para la proxima vez.
+                por_clave[clave] = {'estado': 'timeout', 'todos': []}
+                continue
+            try:
+                todos, fuentes, cache_usado = futuro.result()
+            except Exception as e:
+                por_clave[clave] = {'estado': 'error', 'error': str(e), 'todos': []}
+                continue
+            por_clave[clave] = {
+                'estado': 'ok',
+                'todos': todos,
+                'total': len(todos),
+                'fuentes': fuentes,
+                'cache_usado': cache_usado,
+            }
+
+        grabar = [(unicas[clave], r['todos']) for clave, r in por_clave.items() if r['estado'] == 'ok']
+        snapshot = history_service.record_snapshots(grabar)
+        for (query, todos), cambios in zip(grabar, snapshot.get('changes', [])):
+            resultado = por_clave[normalizar_query_cache(query)]
+            resultado['todos'] = todos[:limite]
+            aplicar_cambios_de_historial(resultado['todos'], cambios)
+
+        respuesta = [dict(por_clave[normalizar_query_cache(q)], query=q) for q in queries]
+        return respuesta_json(
+            {
+                'resultados': respuesta,
+                'historial': {
+                    'guardado': snapshot.get('saved', False),
+                    'encolado': snapshot.get('queued', False),
+                    'backend': snapshot.get('backend'),
+                    'capturado_en': snapshot.get('captured_at'),
+                },
+            },
+            # Sin tiempos ni fechas: un chequeo repetido sin cambios da 304.
+            etag_de=[[r['query'], r['estado'], sin_volatiles(r['todos'])] for r in respuesta],
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -276,14 +683,18 @@ def buscar_preciosgamer_retry():
         if not query:
             return jsonify({'error': 'La busqueda no puede estar vacia'}), 400
 
-        resultados_pg = scraper.buscar_preciosgamer(query)
+        # Reintento explicito: ignora la cache en memoria pero la actualiza.
+        resultados_pg, _ = scraper.buscar_fuente(
+            'preciosgamer', query, cache=cache_busquedas, refrescar=True
+        )
         cache_usado = False
         if not resultados_pg:
             cache_pg = obtener_cache_preciosgamer(query)
             if cache_pg:
                 resultados_pg = cache_pg
                 cache_usado = True
-        resultados_pg = eliminar_duplicados(resultados_pg)
+        with metrics.span('dedup', fuente='preciosgamer'):
+            resultados_pg = eliminar_duplicados(resultados_pg)
         resultados_pg.sort(key=lambda x: x['precio'] if x['precio'] > 0 else float('inf'))
 
         return jsonify({
@@ -307,6 +718,94 @@ def historial():
         return jsonify({'error': str(e)}), 500
 
 
+def _ids_alertas():
+    ids = request.args.get('ids', '').strip()
+    return {i for i in ids.split(',') if i} if ids else None
+
+
+def _error_alerta(data):
+    """Valida los tipos del cuerpo de `POST /alertas`; devuelve el error o None."""
+    if not isinstance(data, dict):
+        return 'El cuerpo debe ser un objeto JSON'
+    if not isinstance(data.get('query', ''), str):
+        return 'query debe ser texto'
+    if data.get('fingerprint') is not None and not isinstance(data['fingerprint'], str):
+        return 'fingerprint debe ser texto'
+    producto = data.get('producto')
+    if producto is not None and not (
+        isinstance(producto, dict)
+        and all(isinstance(producto.get(k, ''), str) for k in ('nombre', 'tienda', 'link'))
+    ):
+        return 'producto debe ser un item de /buscar'
+    for campo in ('precio_max', 'baja_pct'):
+        valor = data.get(campo)
+        if valor is not None and (isinstance(valor, bool) or not isinstance(valor, (int, float))):
+            return f'{campo} debe ser un numero'
+    return None
+
+
+@app.route('/alertas', methods=['POST'])
+def crear_alerta():
+    """Suscribe una alerta de bajada: query y opcionalmente producto, precio_max y baja_pct"""
+    data = request.get_json() or {}
+    error = _error_alerta(data)
+    if error:
+        return jsonify({'error': error}), 400
+    fingerprint = data.get('fingerprint')
+    if not fingerprint and data.get('producto') is not None:
+        fingerprint = product_fingerprint(data['producto'])
+    try:
+        suscripcion = alert_index.subscribe(
+            data.get('query', ''),
+            fingerprint=fingerprint,
+            precio_max=data.get('precio_max'),
+            baja_pct=data.get('baja_pct'),
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(suscripcion), 201
+
+
+@app.route('/alertas', methods=['GET'])
+def listar_alertas():
+    """Suscripciones de `ids`; sin ids no se listan las de otros usuarios."""
+    ids = _ids_alertas()
+    if ids is None:
+        return jsonify({'error': 'Falta el parametro ids'}), 400
+    return jsonify({'suscripciones': alert_index.subscriptions(ids)})
+
+
+@app.route('/alertas/<sub_id>', methods=['DELETE'])
+def borrar_alerta(sub_id):
+    if not alert_index.unsubscribe(sub_id):
+        return jsonify({'error': 'Alerta inexistente'}), 404
+    return jsonify({'borrada': sub_id})
+
+
+@app.route('/alertas/eventos', methods=['GET'])
+def eventos_alertas():
+    """Alertas disparadas despues de `cursor`. Responde con el cursor para la proxima consulta."""
+    ids = _ids_alertas()
+    if ids is None:
+        return jsonify({'error': 'Falta el parametro ids'}), 400
+    cursor = request.args.get('cursor', 0, type=int)
+    limit = min(max(1, request.args.get('limit', 100, type=int)), 500)
+    return jsonify(alert_index.eventos(cursor=cursor, ids=ids, limit=limit))
+
+
+@app.route('/metrics', methods=['GET'])
+def metricas():
+    """Metricas en formato de texto de Prometheus."""
+    stats = dict(cache_busquedas.stats)
+    consultas = sum(stats.get(k, 0) for k in ('hit', 'stale', 'coalesced', 'miss'))
+    aciertos = sum(stats.get(k, 0) for k in ('hit', 'stale', 'coalesced'))
+    gauges = {
+        'busqueda_cache_eventos': [({'tipo': tipo}, valor) for tipo, valor in stats.items()],
+        'busqueda_cache_hit_ratio': [({}, aciertos / consultas if consultas else 0.0)],
+    }
+    return Response(metrics.render(gauges=gauges), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/robots.txt', methods=['GET'])
 def robots():
     base_url = get_base_url()
@@ -315,6 +814,8 @@ def robots():
         "Allow: /\n"
         "Disallow: /buscar\n"
         "Disallow: /historial\n"
+        "Disallow: /alertas\n"
+        "Disallow: /metrics\n"
         f"Sitemap: {base_url}/sitemap.xml\n"
     )
     return Response(body, mimetype='text/plain')
@@ -0,0 +1,161 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from metrics import metrics
+
+
+class DriverLease:
+    """Driver prestado por el pool, con contador de cargas de pagina."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.page_loads = 0
+        self.broken = False
+        self.created_at = time.time()
+
+    def get(self, url: str) -> None:
+        self.page_loads += 1
+        self.driver.get(url)
+
+
+class DriverPool:
+    """Pool acotado de drivers de Selenium.
+
+    Los drivers se crean con `factory` (que puede devolver None si Chrome no
+    esta disponible), se validan al hacer checkout y se reciclan tras
+    `max_page_loads` cargas o si el llamador los marca como rotos.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], object],
+        size: int = 2,
+        max_page_loads: int = 50,
+        acquire_timeout: float = 20.0,
+    ):
+        self._factory = factory
+        self.size = max(1, size)
+        self.max_page_loads = max(1, max_page_loads)
+        self.acquire_timeout = acquire_timeout
+        self._idle: List[DriverLease] = []
+        self._created = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _create(self) -> Optional[DriverLease]:
+        try:
+            driver = self._factory()
+        except Exception as e:
+            print(f"DriverPool: error al crear driver: {e}")
+            return None
+        return DriverLease(driver) if driver is not None else None
+
+    def _destroy(self, lease: DriverLease) -> None:
+        try:
+            lease.driver.quit()
+        except Exception:
+            pass
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def _is_healthy(self, lease: DriverLease) -> bool:
+        try:
+            lease.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self, background: bool = False) -> None:
+        """Crea drivers hasta llenar el pool."""
+        if background:
+            threading.Thread(target=self.warm_up, name="driver-pool-warmup", daemon=True).start()
+            return
+
+        while True:
+            with self._cond:
+                if self._closed or self._created >= self.size:
+                    return
+                self._created += 1
+            lease = self._create()
+            if lease is None:
+                self._release_slot()
+                return
+            with self._cond:
+                self._idle.append(lease)
+                self._cond.notify()
+
+    def checkout(self, timeout: Optional[float] = None) -> Optional[DriverLease]:
+        """Presta un driver sano, o None si no hay uno disponible a tiempo."""
+        if timeout is None:
+            timeout = self.acquire_timeout
+        deadline = time.time() + timeout
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                if self._idle:
+                    lease = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    lease = None
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+        if lease is not None and not self._is_healthy(lease):
+            print("DriverPool: driver no responde, se recrea")
+            self._destroy(lease)
+            lease = None
+
+        if lease is None:
+            lease = self._create()
+            if lease is None:
+                self._release_slot()
+                return None
+        return lease
+
+    def checkin(self, lease: DriverLease) -> None:
+        """Devuelve un driver al pool, reciclandolo si corresponde."""
+        recycle = lease.broken or lease.page_loads >= self.max_page_loads
+        with self._cond:
+            if not recycle and not self._closed:
+                self._idle.append(lease)
+                self._cond.notify()
+                return
+        self._destroy(lease)
+        self._release_slot()
+
+    @contextmanager
+    def lease(self, timeout: Optional[float] = None) -> Iterator[Optional[DriverLease]]:
+        with metrics.span("driver_acquire") as span:
+            lease = self.checkout(timeout)
+            if lease is None:
+                span["resultado"] = "timeout"
+        if lease is None:
+            yield None
+            return
+        try:
+            yield lease
+        except Exception:
+            lease.broken = True
+            raise
+        finally:
+            self.checkin(lease)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+            self._cond.notify_all()
+        for lease in idle:
+            self._destroy(lease)
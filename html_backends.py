@@ -0,0 +1,280 @@
+import re
+from typing import Callable, Dict, List, Optional, Union
+
+from bs4.dammit import UnicodeDammit
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:  # lxml es opcional; sin el se usa BeautifulSoup.
+    etree = None
+    lxml_html = None
+
+HTML_BACKENDS = ("lxml", "bs4")
+
+
+def lxml_available() -> bool:
+    return lxml_html is not None
+
+
+def _lower(expr: str) -> str:
+    return f"translate({expr}, 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
+
+
+def _class_contains(token: str, ignore_case: bool = False) -> str:
+    """Equivalente XPath de `class_=lambda x: x and token in str(x)` de bs4."""
+    attr = _lower("@class") if ignore_case else "@class"
+    return f"contains({attr}, '{token}')"
+
+
+def _class_is(token: str) -> str:
+    """Equivalente XPath de `class_='token'` de bs4."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {token} ')"
+
+
+def _first(path: str):
+    """XPath que devuelve el primer match en orden de documento, como `find`."""
+    return etree.XPath(f"({path})[1]")
+
+
+# get_text de bs4 ignora comentarios y el contenido de script/style/template.
+_TEXT = "text()[not(ancestor::script or ancestor::style or ancestor::template)]"
+
+if etree is not None:
+    _TEXT_NODES = etree.XPath(f".//{_TEXT}")
+
+    PRECIOSGAMER_SELECTORS = {
+        "productos": etree.XPath(f"//div[{_class_contains('product-b')}]"),
+        "productos_alt": etree.XPath(
+            f"//article | //div[{_class_contains('product')}] | //div[@data-v-5ed66c8a]"
+        ),
+        "descripcion": [
+            _first(f".//div[{_class_contains('product-description')}]"),
+            _first(f".//div[{_class_contains('content-container')}]"),
+        ],
+        "nombre": [
+            _first(f".//a[{_class_contains('title')}]"),
+            _first(f".//a[{_class_contains('link-text')}]"),
+            _first(f".//h3[{_class_contains('title', ignore_case=True)}]"),
+            _first(".//*[@itemprop='name']"),
+        ],
+        "precio": [
+            _first(f".//div[{_class_contains('current-price')}]"),
+            _first(f".//div[{_class_contains('price-value', ignore_case=True)}]"),
+            _first(f".//h2[{_class_contains('price', ignore_case=True)}]"),
+            _first(".//*[@itemprop='price']"),
+        ],
+        "tienda": [
+            _first(f".//p[{_class_contains('reseller', ignore_case=True)}]"),
+            _first(f".//span[{_class_contains('reseller', ignore_case=True)}]"),
+        ],
+        "imagen": _first(".//img"),
+        "link": [
+            _first(f".//a[{_class_contains('img-container')}]"),
+            _first(".//a[@href]"),
+        ],
+    }
+
+    HARDGAMERS_SELECTORS = {
+        "productos": etree.XPath(f"//article[{_class_is('product')}]"),
+        "nombre": _first(f".//h3[{_class_is('product-title')} and @itemprop='name']"),
+        "precio": _first(f".//h2[{_class_is('product-price')} and @itemprop='price']"),
+        "imagen": _first(".//img[@itemprop='image']"),
+        "link": _first(".//a"),
+        "tienda": _first(f".//h4[{_class_is('subtitle')}]"),
+    }
+
+    DESCUENTO_SELECTORS = [
+        _first(f".//span[{_class_contains('descuento', ignore_case=True)}]"),
+        _first(f".//div[{_class_contains('descuento', ignore_case=True)}]"),
+        _first(f".//span[{_class_contains('discount', ignore_case=True)}]"),
+        _first(f".//div[{_class_contains('discount', ignore_case=True)}]"),
+        _first(f".//span[{_class_contains('off', ignore_case=True)}]"),
+    ]
+
+
+def parse_document(markup: Union[str, bytes]):
+    """Parsea HTML con lxml decodificando bytes igual que BeautifulSoup."""
+    if isinstance(markup, bytes):
+        markup = UnicodeDammit(markup, is_html=True).unicode_markup or ""
+    # lxml rechaza strings con declaracion de encoding XML.
+    markup = re.sub(r"^\s*<\?xml[^>]*\?>", "", markup)
+    return lxml_html.document_fromstring(markup)
+
+
+def get_text(el, strip: bool = False) -> str:
+    nodes = _TEXT_NODES(el)
+    if strip:
+        return "".join(t.strip() for t in nodes if t.strip())
+    return "".join(nodes)
+
+
+def _find(el, selectors) -> Optional[object]:
+    for selector in selectors:
+        found = selector(el)
+        if found:
+            return found[0]
+    return None
+
+
+def extraer_descuento(el) -> str:
+    try:
+        descuento_elem = _find(el, DESCUENTO_SELECTORS)
+        if descuento_elem is not None:
+            return get_text(descuento_elem, strip=True)
+
+        descuentos = re.findall(r"\d+%", get_text(el))
+        if descuentos:
+            return f"{descuentos[0]} OFF"
+    except Exception:
+        pass
+    return ""
+
+
+def _root(markup):
+    return parse_document(markup) if isinstance(markup, (str, bytes)) else markup
+
+
+def extract_preciosgamer(
+    markup: Union[str, bytes, object], base_url: str, limpiar_precio: Callable[[str], float]
+) -> List[Dict]:
+    """Version lxml de `OfertasScraper._extract_preciosgamer_from_soup`.
+
+    `markup` puede ser HTML o un documento ya parseado con `parse_document`.
+    """
+    resultados = []
+    root = _root(markup)
+    sel = PRECIOSGAMER_SELECTORS
+
+    productos = sel["productos"](root) or sel["productos_alt"](root)
+
+    for producto in productos[:40]:
+        try:
+            descripcion_container = _find(producto, sel["descripcion"])
+            if descripcion_container is None:
+                descripcion_container = producto
+
+            nombre_elem = _find(descripcion_container, sel["nombre"])
+            precio_elem = _find(producto, sel["precio"])
+            if nombre_elem is None or precio_elem is None:
+                continue
+
+            precio_content = precio_elem.get("content", "")
+            precio_texto = get_text(precio_elem, strip=True)
+            precio = limpiar_precio(precio_content) if precio_content else limpiar_precio(precio_texto)
+            if precio <= 0:
+                continue
+
+            nombre = get_text(nombre_elem, strip=True)
+
+            tienda_elem = _find(descripcion_container, sel["tienda"])
+            tienda = get_text(tienda_elem, strip=True) if tienda_elem is not None else ""
+
+            img_elem = sel["imagen"](producto)
+            imagen = ""
+            if img_elem:
+                imagen = img_elem[0].get("src", "") or img_elem[0].get("data-src", "")
+                if imagen and not imagen.startswith("http"):
+                    if imagen.startswith("//"):
+                        imagen = f"https:{imagen}"
+                    elif imagen.startswith("/"):
+                        imagen = f"https://preciosgamer.com{imagen}"
+                    else:
+                        imagen = f"{base_url}/{imagen}"
+
+            link_elem = _find(producto, sel["link"])
+            link = link_elem.get("href", "") if link_elem is not None else ""
+            if link and not link.startswith("http"):
+                if link.startswith("/"):
+                    link = f"https://preciosgamer.com{link}"
+                else:
+                    link = f"https://preciosgamer.com/{link}"
+            if not link:
+                link = base_url
+
+            resultados.append({
+                "nombre": nombre,
+                "precio": precio,
+                "precio_texto": precio_texto if precio_texto else f"${precio:,.0f}".replace(",", "."),
+                "link": link,
+                "fuente": "PreciosGamer",
+                "tienda": tienda,
+                "imagen": imagen,
+                "descuento": extraer_descuento(producto),
+            })
+        except Exception:
+            continue
+
+    return resultados
+
+
+def extract_hardgamers(
+    markup: Union[str, bytes, object],
+    page_url: str,
+    limpiar_precio: Callable[[str], float],
+    limite: int = 20,
+) -> List[Dict]:
+    """Version lxml de `OfertasScraper._extract_hardgamers_from_soup`.
+
+    `markup` puede ser HTML o un documento ya parseado con `parse_document`;
+    se devuelven hasta `limite` ofertas.
+    """
+    resultados = []
+    root = _root(markup)
+    sel = HARDGAMERS_SELECTORS
+
+    for producto in sel["productos"](root)[:limite]:
+        try:
+            nombre_elem = sel["nombre"](producto)
+            precio_elem = sel["precio"](producto)
+            if not nombre_elem or not precio_elem:
+                continue
+            precio_elem = precio_elem[0]
+            nombre = get_text(nombre_elem[0], strip=True)
+
+            tienda_elem = sel["tienda"](producto)
+            tienda = get_text(tienda_elem[0], strip=True) if tienda_elem else ""
+
+            img_elem = sel["imagen"](producto)
+            imagen = ""
+            if img_elem:
+                imagen = img_elem[0].get("src", "")
+                if imagen and not imagen.startswith("http"):
+                    if imagen.startswith("//"):
+                        imagen = f"https:{imagen}"
+                    elif imagen.startswith("/"):
+                        imagen = f"https://www.hardgamers.com.ar{imagen}"
+                    else:
+                        imagen = f"{page_url.rsplit('/', 1)[0]}/{imagen}"
+
+            precio_content = precio_elem.get("content", "")
+            precio_texto = get_text(precio_elem, strip=True)
+            if precio_content:
+                precio = limpiar_precio(precio_content)
+                precio_texto = f"${precio:,.0f}".replace(",", ".")
+            else:
+                precio = limpiar_precio(precio_texto)
+
+            link_elem = sel["link"](producto)
+            link = link_elem[0].get("href", "") if link_elem else ""
+            if not link.startswith("http"):
+                if link.startswith("/"):
+                    link = f"https://www.hardgamers.com.ar{link}"
+                else:
+                    link = f"https://www.hardgamers.com.ar/{link}"
+
+            if nombre and precio > 0:
+                resultados.append({
+                    "nombre": nombre,
+                    "precio": precio,
+                    "precio_texto": precio_texto,
+                    "link": link,
+                    "fuente": "HardGamers",
+                    "tienda": tienda,
+                    "imagen": imagen,
+                    "descuento": extraer_descuento(producto),
+                })
+        except Exception:
+            continue
+
+    return resultados
@@ -0,0 +1,65 @@
+import os
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def _build_retry(total: int, backoff: float, jitter: float) -> Retry:
+    kwargs = {
+        "total": total,
+        "connect": total,
+        "read": total,
+        "status": total,
+        "backoff_factor": backoff,
+        "status_forcelist": RETRY_STATUSES,
+        "respect_retry_after_header": True,
+        # Devolver la ultima respuesta en vez de lanzar RetryError, asi los
+        # llamadores siguen chequeando status_code como antes.
+        "raise_on_status": False,
+    }
+    try:
+        return Retry(backoff_jitter=jitter, **kwargs)
+    except TypeError:
+        # urllib3 < 2 no soporta jitter.
+        return Retry(**kwargs)
+
+
+def create_session(
+    headers: Optional[Dict[str, str]] = None,
+    pool_maxsize: Optional[int] = None,
+    retries: Optional[int] = None,
+    backoff: Optional[float] = None,
+    jitter: Optional[float] = None,
+) -> requests.Session:
+    """Crea una Session con pool por host, keep-alive y reintentos con backoff.
+
+    Los valores no indicados salen de `HTTP_POOL_MAXSIZE`, `HTTP_RETRIES`,
+    `HTTP_BACKOFF` y `HTTP_BACKOFF_JITTER`. Accept-Encoding incluye `br`
+    solo si hay un decodificador brotli instalado.
+    """
+    if pool_maxsize is None:
+        pool_maxsize = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+    if retries is None:
+        retries = int(os.getenv("HTTP_RETRIES", "2"))
+    if backoff is None:
+        backoff = float(os.getenv("HTTP_BACKOFF", "0.3"))
+    if jitter is None:
+        jitter = float(os.getenv("HTTP_BACKOFF_JITTER", "0.2"))
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_maxsize,
+        pool_maxsize=pool_maxsize,
+        max_retries=_build_retry(retries, backoff, jitter),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(make_headers(keep_alive=True, accept_encoding=True))
+    if headers:
+        session.headers.update(headers)
+    return session
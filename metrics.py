@@ -0,0 +1,149 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Limites (segundos) de los histogramas de spans.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(values: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in values.items() if v is not None))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Valor de una muestra sin perder digitos (`:g` redondea a 6)."""
+    value = float(value)
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class Metrics:
+    """Instrumentacion liviana en memoria.
+
+    - `span(nombre, **etiquetas)` mide un bloque y lo acumula en el
+      histograma `<prefix>_span_seconds`, con etiqueta `resultado` (`ok`,
+      `error` si hubo excepcion, o lo que el bloque asigne).
+    - `inc(nombre, **etiquetas)` suma a `<prefix>_<nombre>_total`.
+    - `render()` devuelve todo en formato de texto de Prometheus.
+
+    Entre `start_request()` y `end_request()` los spans tambien se juntan
+    por request (via `contextvars`) para armar un header `Server-Timing`.
+    """
+
+    def __init__(self, prefix: str = "mejorprecio", buckets: Tuple[float, ...] = BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._histograms: Dict[Labels, List] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._request: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar(
+            "metrics_request", default=None
+        )
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = _labels(dict(labels, span=name))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            hist[0][bisect_left(self.buckets, seconds)] += 1
+            hist[1] += seconds
+            hist[2] += 1
+        timings = self._request.get()
+        if timings is not None:
+            fuente = labels.get("fuente")
+            timings.append((f"{fuente}.{name}" if fuente else name, seconds))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextmanager
+    def span(self, name: str, **labels) -> Iterator[Dict[str, object]]:
+        tags: Dict[str, object] = {"resultado": "ok"}
+        inicio = time.perf_counter()
+        try:
+            yield tags
+        except BaseException:
+            tags["resultado"] = "error"
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - inicio, **labels, **tags)
+
+    def start_request(self):
+        return self._request.set([])
+
+    def end_request(self, token) -> List[Tuple[str, float]]:
+        timings = self._request.get() or []
+        self._request.reset(token)
+        return timings
+
+    @staticmethod
+    def server_timing(timings: List[Tuple[str, float]]) -> str:
+        """Header `Server-Timing` sumando los spans con el mismo nombre."""
+        totales: Dict[str, float] = {}
+        for name, seconds in timings:
+            totales[name] = totales.get(name, 0.0) + seconds
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in totales.items())
+
+    def render(self, gauges: Optional[Dict[str, List[Tuple[Dict[str, object], float]]]] = None) -> str:
+        """Exposicion en formato de texto de Prometheus.
+
+        `gauges` agrega valores calculados al momento: `{nombre: [(etiquetas, valor)]}`.
+        """
+        lines = []
+        with self._lock:
+            histograms = {k: (list(v[0]), v[1], v[2]) for k, v in self._histograms.items()}
+            counters = dict(self._counters)
+
+        name = f"{self.prefix}_span_seconds"
+        lines.append(f"# HELP {name} Duracion de spans instrumentados.")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, (counts, total, count) in sorted(histograms.items()):
+            acumulado = 0
+            for limite, cantidad in zip(self.buckets, counts):
+                acumulado += cantidad
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', repr(limite)))} {acumulado}")
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        por_nombre: Dict[str, List[Tuple[Labels, float]]] = {}
+        for (counter, labels), value in counters.items():
+            por_nombre.setdefault(counter, []).append((labels, value))
+        for counter, values in sorted(por_nombre.items()):
+            name = f"{self.prefix}_{counter}_total"
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(values):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for gauge, values in sorted((gauges or {}).items()):
+            name = f"{self.prefix}_{gauge}"
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted((_labels(labels), value) for labels, value in values):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
@@ -0,0 +1,337 @@
+import re
+import unicodedata
+from typing import Dict, Iterator, List, Optional, Union
+
+# Nuxt 2 serializa el estado como `window.__NUXT__=(function(a,b,...){return {...}}(1,"x",...))`.
+# Este modulo interpreta solo ese subconjunto de JavaScript (literales,
+# referencias a parametros y asignaciones simples previas al `return`); no
+# ejecuta codigo.
+
+_MARCADOR = re.compile(r"window\.__NUXT__\s*=\s*")
+_ESPACIO = re.compile(r"(?:\s+|/\*.*?\*/)*", re.S)
+_IDENT = re.compile(r"[A-Za-z_$][\w$]*")
+_NUMERO = re.compile(r"-?(?:0[xX][0-9a-fA-F]+|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)")
+_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "0": "\0"}
+_CONSTANTES = {"true": True, "false": False, "null": None, "undefined": None}
+
+
+class NuxtPayloadError(ValueError):
+    pass
+
+
+class _Parser:
+    def __init__(self, texto: str, pos: int = 0):
+        self.texto = texto
+        self.pos = pos
+        self.variables: Dict[str, object] = {}
+
+    def _error(self, mensaje: str) -> NuxtPayloadError:
+        return NuxtPayloadError(f"{mensaje} en posicion {self.pos}")
+
+    def _saltar(self) -> None:
+        self.pos = _ESPACIO.match(self.texto, self.pos).end()
+
+    def _ver(self) -> str:
+        self._saltar()
+        return self.texto[self.pos:self.pos + 1]
+
+    def _esperar(self, token: str) -> None:
+        self._saltar()
+        if not self.texto.startswith(token, self.pos):
+            raise self._error(f"se esperaba {token!r}")
+        self.pos += len(token)
+
+    def _opcional(self, token: str) -> bool:
+        self._saltar()
+        if self.texto.startswith(token, self.pos):
+            self.pos += len(token)
+            return True
+        return False
+
+    def _ident(self) -> str:
+        self._saltar()
+        match = _IDENT.match(self.texto, self.pos)
+        if not match:
+            raise self._error("se esperaba un identificador")
+        self.pos = match.end()
+        return match.group()
+
+    def payload(self):
+        """`(function(params){...return expr}(args))`, con o sin la IIFE."""
+        if self._ver() != "(" or not re.match(r"\(\s*function\b", self.texto[self.pos:self.pos + 40]):
+            return self.valor()
+
+        self._esperar("(")
+        self._esperar("function")
+        self._esperar("(")
+        params = []
+        while not self._opcional(")"):
+            params.append(self._ident())
+            self._opcional(",")
+        self._esperar("{")
+        inicio_cuerpo = self.pos
+        self._saltar_cuerpo()
+        fin_cuerpo = self.pos - 1
+
+        # Los argumentos van despues del cuerpo: `}(args))` o `})(args)`.
+        cerrado = self._opcional(")")
+        self._esperar("(")
+        args = []
+        while not self._opcional(")"):
+            args.append(self.valor())
+            self._opcional(",")
+        if not cerrado:
+            self._esperar(")")
+        fin = self.pos
+
+        self.variables = dict(zip(params, args + [None] * (len(params) - len(args))))
+        self.pos = inicio_cuerpo
+        resultado = self._cuerpo(fin_cuerpo)
+        self.pos = fin
+        return resultado
+
+    def _saltar_cuerpo(self) -> None:
+        """Avanza hasta la `}` que cierra la funcion, respetando strings."""
+        profundidad = 1
+        while profundidad:
+            self._saltar()
+            if self.pos >= len(self.texto):
+                raise self._error("cuerpo sin cerrar")
+            char = self.texto[self.pos]
+            if char in "\"'":
+                self._string()
+                continue
+            if char in "{[(":
+                profundidad += 1
+            elif char in "}])":
+                profundidad -= 1
+            self.pos += 1
+
+    def _cuerpo(self, fin: int):
+        # Sentencias `x.a=...;` o `x[0]=...;` (referencias circulares) y el return.
+        while self.pos < fin:
+            self._saltar()
+            if self.texto.startswith("return", self.pos) and not _IDENT.match(self.texto, self.pos + 6):
+                self.pos += 6
+                return self.valor()
+            destino, clave = self._destino()
+            self._esperar("=")
+            valor = self.valor()
+            if clave is None:
+                self.variables[destino] = valor
+            else:
+                destino[clave] = valor
+            self._opcional(";")
+        raise self._error("la funcion no tiene return")
+
+    def _destino(self):
+        nombre = self._ident()
+        if nombre == "var":
+            return self._ident(), None
+        actual, clave = self.variables, nombre
+        while True:
+            if self._opcional("."):
+                actual, clave = self._resolver(actual, clave), self._ident()
+            elif self._opcional("["):
+                actual, clave = self._resolver(actual, clave), self.valor()
+                self._esperar("]")
+            else:
+                break
+        if actual is self.variables:
+            return nombre, None
+        return actual, clave
+
+    def _resolver(self, contenedor, clave):
+        try:
+            return contenedor[clave]
+        except (KeyError, IndexError, TypeError):
+            raise self._error(f"referencia invalida {clave!r}")
+
+    def valor(self):
+        char = self._ver()
+        if char == "{":
+            return self._objeto()
+        if char == "[":
+            return self._lista()
+        if char in "\"'":
+            return self._string()
+        if char == "-" or char == "." or char.isdigit():
+            return self._numero()
+        nombre = self._ident()
+        if nombre in _CONSTANTES:
+            return _CONSTANTES[nombre]
+        if nombre == "void":
+            self.valor()
+            return None
+        if nombre == "new" and self._ident() == "Date":
+            self._esperar("(")
+            valor = self.valor()
+            self._esperar(")")
+            return valor
+        if nombre in self.variables:
+            return self.variables[nombre]
+        raise self._error(f"identificador desconocido {nombre!r}")
+
+    def _objeto(self) -> Dict:
+        self._esperar("{")
+        resultado = {}
+        while not self._opcional("}"):
+            char = self._ver()
+            if char in "\"'":
+                clave = self._string()
+            elif char.isdigit():
+                clave = str(self._numero())
+            else:
+                clave = self._ident()
+            self._esperar(":")
+            resultado[clave] = self.valor()
+            if not self._opcional(","):
+                self._esperar("}")
+                break
+        return resultado
+
+    def _lista(self) -> List:
+        self._esperar("[")
+        resultado = []
+        while not self._opcional("]"):
+            # `[,1]`: huecos como undefined.
+            resultado.append(None if self._ver() == "," else self.valor())
+            if not self._opcional(","):
+                self._esperar("]")
+                break
+        return resultado
+
+    def _numero(self) -> Union[int, float]:
+        self._saltar()
+        match = _NUMERO.match(self.texto, self.pos)
+        if not match:
+            raise self._error("numero invalido")
+        self.pos = match.end()
+        texto = match.group()
+        if "x" in texto.lower():
+            return int(texto, 16)
+        numero = float(texto)
+        return int(numero) if numero.is_integer() and not re.search(r"[.eE]", texto) else numero
+
+    def _string(self) -> str:
+        texto = self.texto
+        comilla = texto[self.pos]
+        pos = self.pos + 1
+        partes = []
+        while True:
+            fin = pos
+            while fin < len(texto) and texto[fin] not in (comilla, "\\"):
+                fin += 1
+            partes.append(texto[pos:fin])
+            if fin >= len(texto):
+                raise self._error("string sin cerrar")
+            if texto[fin] == comilla:
+                self.pos = fin + 1
+                return "".join(partes)
+            escape = texto[fin + 1:fin + 2]
+            pos = fin + 2
+            if escape == "u":
+                if texto[pos:pos + 1] == "{":
+                    cierre = texto.index("}", pos)
+                    partes.append(chr(int(texto[pos + 1:cierre], 16)))
+                    pos = cierre + 1
+                else:
+                    partes.append(chr(int(texto[pos:pos + 4], 16)))
+                    pos += 4
+            elif escape == "x":
+                partes.append(chr(int(texto[pos:pos + 2], 16)))
+                pos += 2
+            elif escape == "\n":
+                pass
+            else:
+                partes.append(_ESCAPES.get(escape, escape))
+
+
+def parse_nuxt_state(markup: Union[str, bytes]) -> Optional[Dict]:
+    """Devuelve el objeto `window.__NUXT__` de una pagina, o None si no hay."""
+    if isinstance(markup, bytes):
+        markup = markup.decode("utf-8", "replace")
+    match = _MARCADOR.search(markup)
+    if not match:
+        return None
+    try:
+        estado = _Parser(markup, match.end()).payload()
+    except (NuxtPayloadError, ValueError, IndexError) as e:
+        print(f"Nuxt: no se pudo interpretar el estado: {e}")
+        return None
+    return estado if isinstance(estado, dict) else None
+
+
+def _es_producto(item) -> bool:
+    return isinstance(item, dict) and "description" in item and "currentPrice" in item
+
+
+def _listas_de_productos(estado: Dict) -> Iterator[List[Dict]]:
+    # Primero el store de busqueda; despues los `items` de data/fetch de la pagina.
+    search = (estado.get("state") or {}).get("search") or {}
+    yield search.get("items") or []
+    pendientes = list(estado.get("data") or []) + list((estado.get("fetch") or {}).values())
+    for nodo in pendientes:
+        if isinstance(nodo, dict):
+            for clave in ("items", "products", "productos"):
+                lista = nodo.get(clave)
+                if isinstance(lista, list):
+                    yield lista
+
+
+def _slug(texto: str) -> str:
+    ascii_text = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "_", ascii_text.lower()).strip("_")
+
+
+def producto_preciosgamer(item: Dict, base_url: str) -> Optional[Dict]:
+    """Mapea un producto del estado de PreciosGamer al dict de los extractores HTML."""
+    try:
+        precio = float(item.get("currentPrice") or 0)
+    except (TypeError, ValueError):
+        return None
+    descripcion = " ".join(str(item.get("description") or "").split())
+    if precio <= 0 or not descripcion:
+        return None
+
+    # La pagina muestra la descripcion en minusculas con la inicial en mayuscula.
+    nombre = descripcion.capitalize()
+    if item.get("id") is not None:
+        link = f"https://preciosgamer.com/{_slug(descripcion)}_-_{item['id']}"
+    else:
+        link = item.get("destinyUrl") or base_url
+
+    descuento = ""
+    try:
+        porcentaje = float(item.get("percentage") or 0)
+    except (TypeError, ValueError):
+        porcentaje = 0.0
+    if porcentaje < 0:
+        descuento = f"{round(-porcentaje)}% OFF"
+
+    return {
+        "nombre": nombre,
+        "precio": precio,
+        "precio_texto": f"$ {precio:,.0f}".replace(",", "."),
+        "link": link,
+        "fuente": "PreciosGamer",
+        "tienda": str(item.get("resellerDescription") or "").strip(),
+        "imagen": item.get("defaultImgUrl") or "",
+        "descuento": descuento,
+    }
+
+
+def extract_preciosgamer(markup: Union[str, bytes], base_url: str) -> List[Dict]:
+    """Productos de PreciosGamer leidos del estado Nuxt embebido, sin navegador.
+
+    Devuelve lista vacia si la pagina no trae el estado o no tiene productos;
+    el llamador decide entonces si parsear el HTML o usar Selenium.
+    """
+    estado = parse_nuxt_state(markup)
+    if not estado:
+        return []
+    for lista in _listas_de_productos(estado):
+        productos = [p for p in (producto_preciosgamer(i, base_url) for i in lista if _es_producto(i)) if p]
+        if productos:
+            return productos[:40]
+    return []
@@ -0,0 +1,212 @@
+import json
+import os
+import re
+import threading
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from price_history import normalize_text, product_fingerprint, utc_now_iso
+
+
+def normalize_query(query: str) -> str:
+    """Misma normalizacion que la cache de busquedas de la app."""
+    return re.sub(r"[^\w\s]", "", normalize_text(query)).strip()
+
+
+class AlertIndex:
+    """Suscripciones a bajadas de precio evaluadas en cada snapshot.
+
+    Una suscripcion tiene una `query` y opcionalmente `fingerprint` (un solo
+    producto), `precio_max` (dispara al cruzar hacia abajo ese precio) y
+    `baja_pct` (bajada minima en porcentaje). Sin condiciones dispara ante
+    cualquier bajada. Con `fingerprint`, el producto se sigue en cualquier
+    query en la que aparezca.
+
+    Las suscripciones se indexan por fingerprint y por query normalizada,
+    asi que `evaluar` solo mira los productos del snapshot que tienen alguna
+    suscripcion. Los eventos quedan en un anillo con numero de secuencia,
+    para consultar con un cursor (`eventos(cursor)`).
+    """
+
+    def __init__(self, file_path: Optional[str] = None, max_events: int = 1000):
+        self.file_path = Path(file_path) if file_path else None
+        self._lock = threading.Lock()
+        self._subs: Dict[str, Dict] = {}
+        self._by_fingerprint: Dict[str, Set[str]] = {}
+        self._by_query: Dict[str, Set[str]] = {}
+        self._events: deque = deque(maxlen=max_events)
+        self._seq = 0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.file_path or not self.file_path.exists():
+            return
+        try:
+            data = json.loads(self.file_path.read_text(encoding="utf-8-sig"))
+        except Exception as e:
+            print(f"Alertas: no se pudo leer {self.file_path}: {e}")
+            return
+        for sub in data.get("subscriptions", []):
+            self._index(sub)
+        self._events.extend(data.get("events", []))
+        self._seq = int(data.get("seq", 0))
+
+    def _save(self) -> None:
+        if not self.file_path:
+            return
+        payload = {
+            "seq": self._seq,
+            "subscriptions": list(self._subs.values()),
+            "events": list(self._events),
+        }
+        try:
+            self.file_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.file_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            tmp_path.replace(self.file_path)
+        except OSError as e:
+            print(f"Alertas: no se pudo guardar {self.file_path}: {e}")
+
+    def _index(self, sub: Dict) -> None:
+        self._subs[sub["id"]] = sub
+        if sub.get("fingerprint"):
+            self._by_fingerprint.setdefault(sub["fingerprint"], set()).add(sub["id"])
+        else:
+            self._by_query.setdefault(sub["query_key"], set()).add(sub["id"])
+
+    def subscribe(
+        self,
+        query: str,
+        fingerprint: Optional[str] = None,
+        precio_max: Optional[float] = None,
+        baja_pct: Optional[float] = None,
+    ) -> Dict:
+        query_key = normalize_query(query)
+        if not query_key:
+            raise ValueError("La query no puede estar vacia")
+        sub = {
+            "id": uuid.uuid4().hex,
+            "query": query.strip(),
+            "query_key": query_key,
+            "fingerprint": fingerprint or None,
+            "precio_max": float(precio_max) if precio_max is not None else None,
+            "baja_pct": abs(float(baja_pct)) if baja_pct is not None else None,
+            "created_at": utc_now_iso(),
+        }
+        with self._lock:
+            self._index(sub)
+            self._save()
+        return dict(sub)
+
+    def unsubscribe(self, sub_id: str) -> bool:
+        with self._lock:
+            sub = self._subs.pop(sub_id, None)
+            if sub is None:
+                return False
+            if sub.get("fingerprint"):
+                index, key = self._by_fingerprint, sub["fingerprint"]
+            else:
+                index, key = self._by_query, sub["query_key"]
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(sub_id)
+                if not ids:
+                    del index[key]
+            self._save()
+        return True
+
+    def subscriptions(self, ids: Optional[Iterable[str]] = None) -> List[Dict]:
+        with self._lock:
+            if ids is None:
+                return [dict(sub) for sub in self._subs.values()]
+            return [dict(self._subs[i]) for i in ids if i in self._subs]
+
+    @staticmethod
+    def _dispara(sub: Dict, change: Dict) -> bool:
+        previous = change.get("previous_price")
+        current = change.get("current_price")
+        if previous is None or current is None:
+            # Producto nuevo: solo cuenta si ya entra bajo el precio pedido.
+            return sub.get("precio_max") is not None and current is not None and current <= sub["precio_max"]
+        if current >= previous:
+            return False
+        if sub.get("precio_max") is not None and not (current <= sub["precio_max"] < previous):
+            return False
+        if sub.get("baja_pct") is not None and -change.get("delta_pct", 0.0) < sub["baja_pct"]:
+            return False
+        return True
+
+    def evaluar(
+        self,
+        snapshots: List[Tuple[str, List[Dict]]],
+        changes: List[Dict[str, Dict]],
+        captured_at: str,
+    ) -> int:
+        """Evalua los cambios de un lote de snapshots y devuelve cuantos eventos genero."""
+        if not self._subs:
+            return 0
+        nuevos = 0
+        disparadas = set()
+        with self._lock:
+            for (query, products), cambios in zip(snapshots, changes):
+                query_subs = self._by_query.get(normalize_query(query), ())
+                matches = []
+                for key, change in cambios.items():
+                    for sub_id in list(query_subs) + list(self._by_fingerprint.get(key, ())):
+                        # Un producto repetido en varias queries del lote dispara una vez.
+                        if (sub_id, key) not in disparadas and self._dispara(self._subs[sub_id], change):
+                            disparadas.add((sub_id, key))
+                            matches.append((sub_id, key, change))
+                if not matches:
+                    continue
+                por_key = {}
+                for product in products:
+                    por_key.setdefault(product_fingerprint(product), product)
+                for sub_id, key, change in matches:
+                    product = por_key.get(key, {})
+                    self._seq += 1
+                    self._events.append({
+                        "seq": self._seq,
+                        "subscription_id": sub_id,
+                        "query": query,
+                        "fingerprint": key,
+                        "nombre": product.get("nombre", ""),
+                        "tienda": product.get("tienda", ""),
+                        "fuente": product.get("fuente", ""),
+                        "link": product.get("link", ""),
+                        "captured_at": captured_at,
+                        **change,
+                    })
+                    nuevos += 1
+            if nuevos:
+                self._save()
+        return nuevos
+
+    def eventos(self, cursor: int = 0, ids: Optional[Set[str]] = None, limit: int = 100) -> Dict:
+        """Eventos con `seq` > `cursor`; el `cursor` devuelto sirve para la proxima consulta."""
+        with self._lock:
+            events = self._events
+            if not events or cursor >= self._seq:
+                # Un cursor adelantado (por ejemplo, tras reiniciar sin archivo) se reubica.
+                return {"eventos": [], "cursor": self._seq}
+            # Las secuencias del anillo son consecutivas: se salta directo al cursor.
+            start = max(0, cursor - events[0]["seq"] + 1)
+            result = []
+            last = cursor
+            for i in range(start, len(events)):
+                event = events[i]
+                last = event["seq"]
+                if ids is None or event["subscription_id"] in ids:
+                    result.append(dict(event))
+                    if len(result) >= limit:
+                        break
+            return {"eventos": result, "cursor": last}
+
+
+def create_alert_index() -> AlertIndex:
+    return AlertIndex(
+        file_path=os.getenv("PRICE_ALERTS_FILE", "data/price_alerts.json") or None,
+        max_events=int(os.getenv("PRICE_ALERTS_MAX_EVENTS", "1000")),
+    )
@@ -1,13 +1,23 @@
 import base64
+import copy
 import hashlib
+import heapq
 import json
 import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
 
 import requests
 
+from http_session import create_session
+from metrics import metrics
+
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -33,8 +43,381 @@ def product_fingerprint(product: Dict) -> str:
     return hashlib.sha1(key.encode("utf-8")).hexdigest()
 
 
+def price_change(prev_price: Optional[float], current_price: float) -> Dict:
+    if prev_price is not None:
+        delta = round(current_price - prev_price, 2)
+        pct = round((delta / prev_price) * 100, 2) if prev_price > 0 else 0.0
+    else:
+        delta = 0.0
+        pct = 0.0
+    return {
+        "previous_price": prev_price,
+        "current_price": current_price,
+        "delta": delta,
+        "delta_pct": pct,
+    }
+
+
+def apply_price_points(
+    product_map: Dict, query: str, products: List[Dict], captured_at: str, max_points: int
+) -> Dict:
+    """Agrega un punto de precio por producto a `product_map` y devuelve los cambios."""
+    changes = {}
+
+    for product in products:
+        key = product_fingerprint(product)
+        current_price = float(product.get("precio", 0) or 0)
+        if current_price <= 0:
+            continue
+
+        entry = product_map.setdefault(
+            key,
+            {
+                "id": key,
+                "nombre": product.get("nombre", ""),
+                "tienda": product.get("tienda", ""),
+                "fuente": product.get("fuente", ""),
+                "link": product.get("link", ""),
+                "imagen": product.get("imagen", ""),
+                "history": [],
+            },
+        )
+
+        history = entry["history"]
+        if not isinstance(history, deque) or history.maxlen != max_points:
+            # Anillo de capacidad fija: al agregar se descarta el punto mas viejo.
+            history = entry["history"] = deque(history, maxlen=max_points)
+        prev_price = history[-1]["precio"] if history else None
+        entry["nombre"] = product.get("nombre", entry.get("nombre", ""))
+        entry["tienda"] = product.get("tienda", entry.get("tienda", ""))
+        entry["fuente"] = product.get("fuente", entry.get("fuente", ""))
+        entry["link"] = product.get("link", entry.get("link", ""))
+        entry["imagen"] = product.get("imagen", entry.get("imagen", ""))
+        entry["last_seen_at"] = captured_at
+        history.append(
+            {
+                "captured_at": captured_at,
+                "precio": current_price,
+                "query": query,
+            }
+        )
+
+        changes[key] = price_change(prev_price, current_price)
+
+    return changes
+
+
+def prune_products(product_map: Dict, max_products: int) -> Dict:
+    """Conserva los `max_products` productos vistos mas recientemente."""
+    if len(product_map) <= max_products:
+        return product_map
+    sorted_items = sorted(
+        product_map.items(),
+        key=lambda item: item[1].get("last_seen_at", ""),
+        reverse=True,
+    )
+    return dict(sorted_items[:max_products])
+
+
+class HistoryIndex:
+    """Indice de busqueda sobre el mapa `fingerprint -> producto` del historial.
+
+    - Indice invertido token -> fingerprints del nombre normalizado, con un
+      vocabulario ordenado para buscar por prefijo, los sufijos ordenados de
+      cada token para buscar por substring con `bisect`, y otro por tienda
+      normalizada.
+    - Orden por recencia (`OrderedDict`, el ultimo tocado al final), para
+      sacar los N mas recientes sin ordenar todo.
+
+    `search` devuelve lo mismo que el filtro lineal original: la busqueda
+    normalizada tiene que ser substring del nombre o de la tienda. Se
+    actualiza con `touch`/`remove` a medida que cambia `products`.
+    """
+
+    def __init__(self, products: Dict[str, Dict]):
+        self.products = products
+        self._recency: "OrderedDict[str, None]" = OrderedDict()
+        self._terms: Dict[str, Tuple[Tuple[str, ...], str]] = {}
+        self._tokens: Dict[str, Set[str]] = {}
+        self._vocab: List[str] = []
+        # (sufijo, token) ordenados: un substring de un token es prefijo de
+        # alguno de sus sufijos, asi que se ubica con un rango de bisect.
+        self._suffixes: List[Tuple[str, str]] = []
+        self._stores: Dict[str, Set[str]] = {}
+
+        ordered = sorted(products.items(), key=lambda item: item[1].get("last_seen_at", "") or "")
+        # La carga inicial agrega sin ordenar y ordena una sola vez al final:
+        # con `insort` por token seria cuadratica en el tamano del vocabulario.
+        for key, entry in ordered:
+            self._add(key, entry, keep_sorted=False)
+        self._vocab.sort()
+        self._suffixes.sort()
+
+    def __len__(self) -> int:
+        return len(self._recency)
+
+    def _add(self, key: str, entry: Dict, keep_sorted: bool = True) -> None:
+        tokens = tuple(set(normalize_text(entry.get("nombre", "")).split()))
+        store = normalize_store(entry.get("tienda", ""))
+        self._terms[key] = (tokens, store)
+        for token in tokens:
+            keys = self._tokens.get(token)
+            if keys is None:
+                keys = self._tokens[token] = set()
+                suffixes = [(token[i:], token) for i in range(len(token))]
+                if keep_sorted:
+                    insort(self._vocab, token)
+                    for suffix in suffixes:
+                        insort(self._suffixes, suffix)
+                else:
+                    self._vocab.append(token)
+                    self._suffixes.extend(suffixes)
+            keys.add(key)
+        self._stores.setdefault(store, set()).add(key)
+        self._recency[key] = None
+
+    def touch(self, keys: Iterable[str]) -> None:
+        """Marca `keys` como vistos recien, indexando los nuevos."""
+        for key in keys:
+            if key in self._recency:
+                self._recency.move_to_end(key)
+            elif key in self.products:
+                self._add(key, self.products[key])
+
+    def remove(self, key: str) -> None:
+        terms = self._terms.pop(key, None)
+        if terms is None:
+            return
+        tokens, store = terms
+        for token in tokens:
+            keys = self._tokens[token]
+            keys.discard(key)
+            if not keys:
+                del self._tokens[token]
+                del self._vocab[bisect_left(self._vocab, token)]
+                for i in range(len(token)):
+                    del self._suffixes[bisect_left(self._suffixes, (token[i:], token))]
+        stores = self._stores[store]
+        stores.discard(key)
+        if not stores:
+            del self._stores[store]
+        self._recency.pop(key, None)
+
+    def evict(self, max_products: int) -> List[str]:
+        """Saca de `products` los menos recientes hasta dejar `max_products`.
+
+        Cuesta O(desalojados): no ordena ni reconstruye el mapa.
+        """
+        evicted = []
+        while len(self._recency) > max_products:
+            key = next(iter(self._recency))
+            self.remove(key)
+            self.products.pop(key, None)
+            evicted.append(key)
+        return evicted
+
+    def _prefixed(self, prefix: str) -> Set[str]:
+        keys: Set[str] = set()
+        vocab = self._vocab
+        # Sin slices: copiar la cola del vocabulario costaria O(vocabulario).
+        for i in range(bisect_left(vocab, prefix), len(vocab)):
+            token = vocab[i]
+            if not token.startswith(prefix):
+                break
+            keys |= self._tokens[token]
+        return keys
+
+    def _containing(self, needle: str) -> Set[str]:
+        keys: Set[str] = set()
+        suffixes = self._suffixes
+        for i in range(bisect_left(suffixes, (needle,)), len(suffixes)):
+            suffix, token = suffixes[i]
+            if not suffix.startswith(needle):
+                break
+            keys |= self._tokens[token]
+        return keys
+
+    def _matches(self, key: str, needle: str) -> bool:
+        return needle in normalize_text(self.products[key].get("nombre", ""))
+
+    def _candidates(self, needle: str) -> Tuple[Set[str], bool]:
+        """Superconjunto de coincidencias y si hace falta verificarlas."""
+        words = needle.split(" ")
+        if len(words) == 1:
+            # Sin espacios la busqueda cae dentro de un solo token del nombre,
+            # o en la tienda (que no tiene espacios).
+            keys = self._containing(needle)
+            for store, store_keys in self._stores.items():
+                if needle in store:
+                    keys |= store_keys
+            return keys, False
+
+        # Con espacios solo puede coincidir el nombre: las palabras del medio
+        # son tokens completos y la ultima es prefijo de un token.
+        groups = [self._tokens.get(word, set()) for word in words[1:-1]]
+        groups.append(self._prefixed(words[-1]))
+        groups.sort(key=len)
+        keys = set(groups[0])
+        for group in groups[1:]:
+            keys &= group
+        return keys, True
+
+    def search(self, query: Optional[str], limit: int) -> List[Dict]:
+        """Hasta `limit` productos que coinciden con `query`, mas recientes primero."""
+        needle = normalize_text(query) if query else ""
+        if not needle:
+            keys = []
+            for key in reversed(self._recency):
+                keys.append(key)
+                if len(keys) >= limit:
+                    break
+            return [self.products[key] for key in keys]
+
+        candidates, verify = self._candidates(needle)
+        if len(candidates) * 8 >= len(self._recency):
+            # Muchos candidatos: alcanza con recorrer por recencia.
+            keys = []
+            for key in reversed(self._recency):
+                if key in candidates and (not verify or self._matches(key, needle)):
+                    keys.append(key)
+                    if len(keys) >= limit:
+                        break
+        else:
+            if verify:
+                candidates = [key for key in candidates if self._matches(key, needle)]
+            keys = heapq.nlargest(
+                limit, candidates, key=lambda key: self.products[key].get("last_seen_at", "") or ""
+            )
+        return [self.products[key] for key in keys]
+
+
+def merge_history_docs(theirs: Dict, ours: Dict, max_points: int, max_products: int) -> Dict:
+    """Une dos documentos de historial por fingerprint y `captured_at`.
+
+    Los puntos de ambos lados se conservan (sin repetir) y los datos del
+    producto salen del lado que lo vio por ultima vez.
+    """
+    products = copy.deepcopy(theirs.get("products", {}))
+    for key, entry in ours.get("products", {}).items():
+        current = products.get(key)
+        if current is None:
+            products[key] = copy.deepcopy(entry)
+            continue
+        points = {}
+        for point in list(current.get("history", [])) + list(entry.get("history", [])):
+            points[(point.get("captured_at", ""), point.get("query", ""), point.get("precio"))] = point
+        history = sorted(points.values(), key=lambda point: point.get("captured_at", ""))
+        newer = entry if entry.get("last_seen_at", "") >= current.get("last_seen_at", "") else current
+        merged = dict(newer, history=copy.deepcopy(history[-max_points:]))
+        merged["last_seen_at"] = max(entry.get("last_seen_at", ""), current.get("last_seen_at", ""))
+        products[key] = merged
+
+    updated = [value for value in (theirs.get("updated_at"), ours.get("updated_at")) if value]
+    return {
+        "version": ours.get("version", theirs.get("version", 1)),
+        "updated_at": max(updated) if updated else None,
+        "products": prune_products(products, max_products),
+    }
+
+
+def encode_history_doc(data: Dict) -> Dict:
+    """Pasa un documento v1 al formato columnar v2.
+
+    v2 guarda una sola vez cada snapshot (`captured_at`, indice de query) en
+    `snapshots` y cada query en `queries`; cada producto lleva arrays
+    paralelos `s` (indice de snapshot) y `p` (precio) en lugar de `history`.
+    """
+    queries: List[str] = []
+    query_ids: Dict[str, int] = {}
+    snapshots: List[List] = []
+    snapshot_ids: Dict[Tuple[str, int], int] = {}
+    products = {}
+
+    for key, entry in data.get("products", {}).items():
+        indexes = []
+        prices = []
+        for point in entry.get("history", []):
+            query = point.get("query", "")
+            query_id = query_ids.get(query)
+            if query_id is None:
+                query_id = query_ids[query] = len(queries)
+                queries.append(query)
+            snapshot = (point.get("captured_at", ""), query_id)
+            snapshot_id = snapshot_ids.get(snapshot)
+            if snapshot_id is None:
+                snapshot_id = snapshot_ids[snapshot] = len(snapshots)
+                snapshots.append(list(snapshot))
+            precio = float(point.get("precio", 0) or 0)
+            indexes.append(snapshot_id)
+            prices.append(int(precio) if precio.is_integer() else precio)
+        compact = {field: value for field, value in entry.items() if field not in ("id", "history")}
+        compact["s"] = indexes
+        compact["p"] = prices
+        products[key] = compact
+
+    return {
+        "version": 2,
+        "updated_at": data.get("updated_at"),
+        "queries": queries,
+        "snapshots": snapshots,
+        "products": products,
+    }
+
+
+def decode_history_doc(data: Dict) -> Dict:
+    """Devuelve el documento en formato v1; los v1 pasan sin cambios."""
+    if data.get("version") != 2:
+        return data
+    queries = data.get("queries", [])
+    snapshots = data.get("snapshots", [])
+    products = {}
+    for key, compact in data.get("products", {}).items():
+        entry = {"id": key}
+        entry.update((field, value) for field, value in compact.items() if field not in ("s", "p"))
+        entry["history"] = [
+            {
+                "captured_at": snapshots[index][0],
+                "precio": float(precio),
+                "query": queries[snapshots[index][1]],
+            }
+            for index, precio in zip(compact.get("s", []), compact.get("p", []))
+        ]
+        products[key] = entry
+    return {
+        "version": 1,
+        "updated_at": data.get("updated_at"),
+        "products": products,
+    }
+
+
+def dump_history_doc(data: Dict, format_version: int) -> str:
+    """Serializa `data` (v1 en memoria) en el formato pedido."""
+    if format_version >= 2:
+        return json.dumps(encode_history_doc(data), ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(data, ensure_ascii=False, indent=2, default=list)
+
+
 class HistoryBackend:
     name = "base"
+    # Los backends incrementales implementan `apply_snapshot` y
+    # `query_history` y no pasan por el documento completo.
+    incremental = False
+    # Segundos minimos entre chequeos de `revision()` de la vista en memoria.
+    revalidate_interval = 0.0
+    # True si el ultimo `write` tuvo que unir el payload con otra version
+    # guardada: el payload quedo actualizado in-place con el resultado.
+    last_write_merged = False
+
+    def revision(self) -> Optional[Hashable]:
+        """Token barato que cambia cuando cambia el documento guardado.
+
+        None significa que el backend no puede saberlo y hay que releer.
+        """
+        return None
+
+    def written_revision(self) -> Optional[Hashable]:
+        """Revision del documento recien escrito por `write`."""
+        return self.revision()
 
     def read(self) -> Dict:
         raise NotImplementedError
@@ -42,37 +425,265 @@ class HistoryBackend:
     def write(self, payload: Dict) -> bool:
         raise NotImplementedError
 
+    def close(self) -> None:
+        pass
+
 
 class LocalJsonHistoryBackend(HistoryBackend):
     name = "local-json"
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, format_version: int = 2):
         self.file_path = Path(file_path)
+        self.format_version = format_version
+
+    def revision(self) -> Optional[Hashable]:
+        try:
+            stat = self.file_path.stat()
+        except FileNotFoundError:
+            return "missing"
+        return (stat.st_mtime_ns, stat.st_size)
 
     def read(self) -> Dict:
         if not self.file_path.exists():
             return {}
         with self.file_path.open("r", encoding="utf-8") as fh:
-            return json.load(fh)
+            return decode_history_doc(json.load(fh))
 
     def write(self, payload: Dict) -> bool:
         self.file_path.parent.mkdir(parents=True, exist_ok=True)
         tmp_path = self.file_path.with_suffix(".tmp")
         with tmp_path.open("w", encoding="utf-8") as fh:
-            json.dump(payload, fh, ensure_ascii=False, indent=2)
+            fh.write(dump_history_doc(payload, self.format_version))
         tmp_path.replace(self.file_path)
         return True
 
 
+class LocalLogHistoryBackend(HistoryBackend):
+    """Historial local append-only en segmentos JSONL con compactacion.
+
+    Cada snapshot agrega una linea compacta al segmento activo
+    (`segment-NNNNNN.jsonl`); el estado vive en memoria como un indice
+    fingerprint -> producto (con su ultimo precio al final de `history`).
+    Cada `compact_every` snapshots se rota el segmento y se escribe
+    `snapshot.json` con el estado podado por `max_points`/`max_products`;
+    al arrancar se carga ese snapshot y se reaplica la cola de segmentos
+    posteriores. Si el directorio esta vacio se siembra desde `seed_file`
+    (el JSON del backend `local`).
+    """
+
+    name = "local-log"
+    incremental = True
+
+    # Orden de campos de cada producto en una linea del log.
+    FIELDS = ("nombre", "tienda", "fuente", "link", "imagen", "precio")
+
+    def __init__(
+        self,
+        directory: str,
+        seed_file: Optional[str] = None,
+        compact_every: int = 200,
+        max_points: int = 30,
+        max_products: int = 1000,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.snapshot_path = self.directory / "snapshot.json"
+        self.compact_every = max(1, compact_every)
+        self.max_points = max_points
+        self.max_products = max_products
+        self._lock = threading.Lock()
+        self._data: Dict = {"version": 1, "updated_at": None, "products": {}}
+        self._segment = 1
+        self._segment_records = 0
+        self._fh = None
+        self._index: Optional[HistoryIndex] = None
+        self._load(seed_file)
+
+    def _search_index(self) -> HistoryIndex:
+        products = self._data["products"]
+        if self._index is None or self._index.products is not products:
+            self._index = HistoryIndex(products)
+        return self._index
+
+    def _segment_path(self, number: int) -> Path:
+        return self.directory / f"segment-{number:06d}.jsonl"
+
+    def _segments(self) -> List[int]:
+        numbers = []
+        for path in self.directory.glob("segment-*.jsonl"):
+            try:
+                numbers.append(int(path.stem.split("-", 1)[1]))
+            except ValueError:
+                continue
+        return sorted(numbers)
+
+    def _load(self, seed_file: Optional[str]) -> None:
+        segments = self._segments()
+        if self.snapshot_path.exists():
+            with self.snapshot_path.open("r", encoding="utf-8") as fh:
+                snapshot = json.load(fh)
+            self._segment = snapshot.pop("segment", 1)
+            self._data.update(decode_history_doc(snapshot))
+        elif not segments and seed_file and Path(seed_file).exists():
+            with Path(seed_file).open("r", encoding="utf-8") as fh:
+                self._data.update(decode_history_doc(json.load(fh)))
+            self._data.setdefault("products", {})
+            self._write_snapshot()
+
+        for number in segments:
+            if number < self._segment:
+                self._segment_path(number).unlink(missing_ok=True)
+                continue
+            self._segment = number
+            self._segment_records = self._replay(self._segment_path(number))
+
+    def _replay(self, path: Path) -> int:
+        records = 0
+        complete = 0
+        with path.open("r+b") as fh:
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    # Linea cortada por un corte abrupto: se descarta y se
+                    # trunca, para que el proximo append no quede pegado a ella.
+                    fh.truncate(complete)
+                    break
+                complete += len(line)
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                products = [dict(zip(self.FIELDS, values)) for values in record["p"]]
+                apply_price_points(self._data["products"], record["q"], products, record["t"], self.max_points)
+                self._data["updated_at"] = record["t"]
+                records += 1
+        return records
+
+    def _append(self, line: str) -> None:
+        if self._fh is None:
+            self._fh = self._segment_path(self._segment).open("a", encoding="utf-8")
+        self._fh.write(line + "\n")
+        self._fh.flush()
+        self._segment_records += 1
+
+    def _write_snapshot(self) -> None:
+        payload = dict(encode_history_doc(self._data), segment=self._segment)
+        tmp_path = self.snapshot_path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as fh:
+            json.dump(payload, fh, ensure_ascii=False, separators=(",", ":"))
+        tmp_path.replace(self.snapshot_path)
+
+    def _compact(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        previous = self._segment
+        self._segment += 1
+        self._segment_records = 0
+        self._search_index().evict(self.max_products)
+        self._write_snapshot()
+        for number in self._segments():
+            if number <= previous:
+                self._segment_path(number).unlink(missing_ok=True)
+
+    def compact(self) -> None:
+        with self._lock:
+            self._compact()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._segment_records:
+                self._compact()
+            elif self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+    def apply_snapshot(
+        self, query: str, products: List[Dict], captured_at: str, max_points: int, max_products: int
+    ) -> Dict:
+        self.max_points = max_points
+        self.max_products = max_products
+        rows = []
+        for product in products:
+            values = [product.get(field, "") for field in self.FIELDS]
+            values[-1] = float(product.get("precio", 0) or 0)
+            if values[-1] > 0:
+                rows.append(values)
+        line = json.dumps({"t": captured_at, "q": query, "p": rows}, ensure_ascii=False, separators=(",", ":"))
+
+        with self._lock:
+            changes = apply_price_points(self._data["products"], query, products, captured_at, max_points)
+            if self._index is not None and self._index.products is self._data["products"]:
+                self._index.touch(changes)
+            self._data["updated_at"] = captured_at
+            self._append(line)
+            if self._segment_records >= self.compact_every:
+                self._compact()
+        return changes
+
+    def query_history(self, query: Optional[str], limit: int) -> Dict:
+        with self._lock:
+            items = self._search_index().search(query, limit)
+            # Copias para no serializar entradas que otro request esta mutando.
+            items = [dict(item, history=list(item.get("history", []))) for item in items]
+            updated_at = self._data.get("updated_at")
+        return {"updated_at": updated_at, "items": items}
+
+    def read(self) -> Dict:
+        with self._lock:
+            return copy.deepcopy(self._data)
+
+    def write(self, payload: Dict) -> bool:
+        """Reemplaza el estado por `payload` y compacta."""
+        with self._lock:
+            self._data = {
+                "version": payload.get("version", 1),
+                "updated_at": payload.get("updated_at"),
+                "products": copy.deepcopy(payload.get("products", {})),
+            }
+            self._compact()
+        return True
+
+
 class GithubJsonHistoryBackend(HistoryBackend):
+    """Historial como archivo JSON de un repo, via la Contents API de GitHub.
+
+    Las lecturas son condicionales (`If-None-Match` con el ETag de la ultima
+    descarga): si el archivo no cambio se devuelve la copia cacheada sin
+    volver a bajarlo. Si otra instancia escribio en el medio (409/422 por
+    sha viejo), se lee la version nueva, se une con la propia con
+    `merge_history_docs` y se reintenta, en lugar de pisarla o descartar
+    el snapshot.
+    """
+
     name = "github-json"
+    CONFLICT_STATUSES = (409, 422)
+    revalidate_interval = 10.0
 
-    def __init__(self, repo: str, file_path: str, token: str, branch: str = "main"):
+    def __init__(
+        self,
+        repo: str,
+        file_path: str,
+        token: str,
+        branch: str = "main",
+        session: Optional[requests.Session] = None,
+        max_points: int = 30,
+        max_products: int = 1000,
+        max_attempts: int = 3,
+        format_version: int = 2,
+    ):
+        self.session = session or create_session()
+        self.sha: Optional[str] = None
         self.repo = repo
         self.file_path = file_path
         self.token = token
         self.branch = branch
+        self.max_points = max_points
+        self.max_products = max_products
+        self.max_attempts = max(1, max_attempts)
+        self.format_version = format_version
         self.base_url = f"https://api.github.com/repos/{repo}/contents/{file_path}"
+        self._etag: Optional[str] = None
+        self._cached: Optional[Dict] = None
 
     def _headers(self) -> Dict[str, str]:
         return {
@@ -82,28 +693,60 @@ class GithubJsonHistoryBackend(HistoryBackend):
             "User-Agent": "price-history-bot",
         }
 
-    def read(self) -> Dict:
-        resp = requests.get(
+    def _fetch(self) -> None:
+        """GET condicional: solo baja y parsea el archivo si cambio."""
+        headers = self._headers()
+        if self._etag and self._cached is not None:
+            headers["If-None-Match"] = self._etag
+        resp = self.session.get(
             self.base_url,
             params={"ref": self.branch},
-            headers=self._headers(),
+            headers=headers,
             timeout=10,
         )
+        if resp.status_code == 304:
+            return
         if resp.status_code == 404:
-            return {}
+            self.sha = self._etag = None
+            self._cached = {}
+            return
         resp.raise_for_status()
         data = resp.json()
-        encoded = data.get("content", "")
-        if not encoded:
+        sha = data.get("sha")
+        if sha != self.sha or self._cached is None:
+            encoded = data.get("content", "")
+            raw = base64.b64decode(encoded).decode("utf-8") if encoded else ""
+            self._cached = decode_history_doc(json.loads(raw)) if raw else {}
+        self.sha = sha
+        self._etag = resp.headers.get("ETag")
+
+    def revision(self) -> Optional[Hashable]:
+        self._fetch()
+        return self.sha or "missing"
+
+    def written_revision(self) -> Optional[Hashable]:
+        # El PUT devuelve el sha nuevo: no hace falta otro GET.
+        return self.sha or "missing"
+
+    def read(self) -> Dict:
+        self._fetch()
+        if not self._cached:
             return {}
-        raw = base64.b64decode(encoded).decode("utf-8")
-        parsed = json.loads(raw)
-        parsed["_github_sha"] = data.get("sha")
+        parsed = copy.deepcopy(self._cached)
+        parsed["_github_sha"] = self.sha
         return parsed
 
-    def write(self, payload: Dict) -> bool:
-        sha = payload.pop("_github_sha", None)
-        content = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+    def _remember_write(self, resp, content: bytes) -> None:
+        try:
+            self.sha = resp.json().get("content", {}).get("sha") or self.sha
+        except ValueError:
+            pass
+        # El ETag de lectura cambia con cada commit y el PUT no lo devuelve;
+        # el contenido si se conoce, asi que el proximo GET no lo reparsea.
+        self._etag = None
+        self._cached = decode_history_doc(json.loads(content))
+
+    def _put(self, content: bytes, sha: Optional[str]):
         body = {
             "message": f"chore: update price history {utc_now_iso()}",
             "content": base64.b64encode(content).decode("utf-8"),
@@ -111,20 +754,373 @@ class GithubJsonHistoryBackend(HistoryBackend):
         }
         if sha:
             body["sha"] = sha
+        return self.session.put(self.base_url, headers=self._headers(), json=body, timeout=15)
 
-        resp = requests.put(self.base_url, headers=self._headers(), json=body, timeout=15)
-        if resp.status_code in (200, 201):
-            return True
-        if resp.status_code == 409:
-            # Retry once on optimistic lock race.
+    def write(self, payload: Dict) -> bool:
+        """Guarda `payload`; si hubo que unirlo con otra version, queda actualizado in-place."""
+        # El sha mas reciente conocido (de la ultima lectura o escritura) gana
+        # sobre el del documento, que puede venir de una vista en memoria vieja.
+        sha = self.sha or payload.pop("_github_sha", None)
+        payload.pop("_github_sha", None)
+        self.last_write_merged = False
+
+        for _ in range(self.max_attempts):
+            content = dump_history_doc(payload, self.format_version).encode("utf-8")
+            resp = self._put(content, sha)
+            if resp.status_code in (200, 201):
+                self._remember_write(resp, content)
+                return True
+            if resp.status_code not in self.CONFLICT_STATUSES:
+                return False
+            # Otro proceso escribio primero: se une su version con la nuestra.
             latest = self.read()
-            latest_sha = latest.get("_github_sha")
-            body["sha"] = latest_sha
-            resp = requests.put(self.base_url, headers=self._headers(), json=body, timeout=15)
-            return resp.status_code in (200, 201)
+            sha = latest.pop("_github_sha", None)
+            if latest:
+                payload.update(merge_history_docs(latest, payload, self.max_points, self.max_products))
+                self.last_write_merged = True
         return False
 
 
+class SqliteHistoryBackend(HistoryBackend):
+    """Historial en SQLite (WAL) con una fila por producto y otra por punto.
+
+    `apply_snapshot` solo toca los productos de la busqueda dentro de una
+    transaccion, y `query_history` usa los indices de `last_seen_at`, de
+    tokens del nombre y de sufijos de tokens y tiendas (un substring de una
+    palabra es prefijo de alguno de sus sufijos), asi que el costo no crece
+    con el historial completo.
+    `read`/`write` siguen disponibles para exportar o importar el documento
+    JSON entero.
+    """
+
+    name = "sqlite"
+    incremental = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE TABLE IF NOT EXISTS products (
+        id TEXT PRIMARY KEY,
+        nombre TEXT NOT NULL DEFAULT '',
+        tienda TEXT NOT NULL DEFAULT '',
+        fuente TEXT NOT NULL DEFAULT '',
+        link TEXT NOT NULL DEFAULT '',
+        imagen TEXT NOT NULL DEFAULT '',
+        last_seen_at TEXT,
+        last_price REAL,
+        point_count INTEGER NOT NULL DEFAULT 0,
+        search_name TEXT NOT NULL DEFAULT '',
+        search_store TEXT NOT NULL DEFAULT ''
+    );
+    CREATE INDEX IF NOT EXISTS idx_products_last_seen ON products (last_seen_at);
+    CREATE TABLE IF NOT EXISTS price_points (
+        product_id TEXT NOT NULL,
+        captured_at TEXT NOT NULL,
+        precio REAL NOT NULL,
+        query TEXT NOT NULL DEFAULT ''
+    );
+    CREATE INDEX IF NOT EXISTS idx_points_product ON price_points (product_id, captured_at);
+    CREATE TABLE IF NOT EXISTS name_tokens (
+        token TEXT NOT NULL,
+        product_id TEXT NOT NULL,
+        PRIMARY KEY (token, product_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_name_tokens_product ON name_tokens (product_id);
+    CREATE INDEX IF NOT EXISTS idx_products_store ON products (search_store);
+    CREATE TABLE IF NOT EXISTS token_suffixes (
+        suffix TEXT NOT NULL,
+        token TEXT NOT NULL,
+        PRIMARY KEY (suffix, token)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = Path(file_path)
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.file_path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+        self._ensure_suffixes()
+
+    def _ensure_suffixes(self) -> None:
+        """Llena `token_suffixes` en bases creadas antes de que existiera."""
+        if self._get_meta("token_suffixes") is not None:
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            words = [row[0] for row in self._conn.execute("SELECT DISTINCT token FROM name_tokens")]
+            words += [row[0] for row in self._conn.execute("SELECT DISTINCT search_store FROM products")]
+            self._add_suffixes(words)
+            self._set_meta("token_suffixes", 1)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _add_suffixes(self, words: Iterable[str]) -> None:
+        # Las filas de palabras que ya no tiene ningun producto quedan: no
+        # cambian resultados (se cruzan con tokens/tiendas vigentes) y el
+        # vocabulario crece mucho mas lento que el historial.
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO token_suffixes (suffix, token) VALUES (?, ?)",
+            [(word[i:], word) for word in set(words) if word for i in range(len(word))],
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _set_meta(self, key: str, value) -> None:
+        self._conn.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, None if value is None else str(value)),
+        )
+
+    def _product_count(self) -> int:
+        value = self._get_meta("product_count")
+        if value is None:
+            value = self._conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            self._set_meta("product_count", value)
+        return int(value)
+
+    def _insert_product(self, key: str, product: Dict) -> None:
+        nombre = product.get("nombre", "")
+        search_name = normalize_text(nombre)
+        self._conn.execute(
+            "INSERT INTO products (id, nombre, tienda, fuente, link, imagen, search_name, search_store) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                nombre,
+                product.get("tienda", ""),
+                product.get("fuente", ""),
+                product.get("link", ""),
+                product.get("imagen", ""),
+                search_name,
+                normalize_store(product.get("tienda", "")),
+            ),
+        )
+        tokens = set(search_name.split())
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO name_tokens (token, product_id) VALUES (?, ?)",
+            [(token, key) for token in tokens],
+        )
+        self._add_suffixes(tokens | {normalize_store(product.get("tienda", ""))})
+
+    def _add_point(
+        self, key: str, point_count: int, captured_at: str, precio: float, query: str, max_points: int
+    ) -> None:
+        self._conn.execute(
+            "INSERT INTO price_points (product_id, captured_at, precio, query) VALUES (?, ?, ?, ?)",
+            (key, captured_at, precio, query),
+        )
+        point_count += 1
+        excess = point_count - max_points
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM price_points WHERE rowid IN ("
+                "SELECT rowid FROM price_points WHERE product_id = ? "
+                "ORDER BY captured_at, rowid LIMIT ?)",
+                (key, excess),
+            )
+            point_count = max_points
+        self._conn.execute(
+            "UPDATE products SET last_price = ?, last_seen_at = ?, point_count = ? WHERE id = ?",
+            (precio, captured_at, point_count, key),
+        )
+
+    def _prune(self, max_products: int) -> None:
+        if self._product_count() <= max_products:
+            return
+        stale = [
+            row["id"]
+            for row in self._conn.execute(
+                "SELECT id FROM products ORDER BY last_seen_at DESC, rowid LIMIT -1 OFFSET ?",
+                (max_products,),
+            )
+        ]
+        for table, column in (("price_points", "product_id"), ("name_tokens", "product_id"), ("products", "id")):
+            self._conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(key,) for key in stale])
+        self._set_meta("product_count", self._product_count() - len(stale))
+
+    def apply_snapshot(
+        self, query: str, products: List[Dict], captured_at: str, max_points: int, max_products: int
+    ) -> Dict:
+        changes = {}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for product in products:
+                    key = product_fingerprint(product)
+                    current_price = float(product.get("precio", 0) or 0)
+                    if current_price <= 0:
+                        continue
+
+                    row = self._conn.execute(
+                        "SELECT last_price, point_count FROM products WHERE id = ?", (key,)
+                    ).fetchone()
+                    if row is None:
+                        self._insert_product(key, product)
+                        self._set_meta("product_count", self._product_count() + 1)
+                        prev_price, point_count = None, 0
+                    else:
+                        prev_price, point_count = row["last_price"], row["point_count"]
+                        self._conn.execute(
+                            "UPDATE products SET nombre = ?, tienda = ?, fuente = ?, link = ?, imagen = ? "
+                            "WHERE id = ?",
+                            (
+                                product.get("nombre", ""),
+                                product.get("tienda", ""),
+                                product.get("fuente", ""),
+                                product.get("link", ""),
+                                product.get("imagen", ""),
+                                key,
+                            ),
+                        )
+
+                    self._add_point(key, point_count, captured_at, current_price, query, max_points)
+                    changes[key] = price_change(prev_price, current_price)
+
+                self._set_meta("updated_at", captured_at)
+                self._prune(max_products)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return changes
+
+    def _history_for(self, ids: List[str]) -> Dict[str, List[Dict]]:
+        history: Dict[str, List[Dict]] = {key: [] for key in ids}
+        if not ids:
+            return history
+        placeholders = ",".join("?" * len(ids))
+        rows = self._conn.execute(
+            f"SELECT product_id, captured_at, precio, query FROM price_points "
+            f"WHERE product_id IN ({placeholders}) ORDER BY product_id, captured_at, rowid",
+            ids,
+        )
+        for row in rows:
+            history[row["product_id"]].append(
+                {"captured_at": row["captured_at"], "precio": row["precio"], "query": row["query"]}
+            )
+        return history
+
+    def _to_item(self, row, history: List[Dict]) -> Dict:
+        return {
+            "id": row["id"],
+            "nombre": row["nombre"],
+            "tienda": row["tienda"],
+            "fuente": row["fuente"],
+            "link": row["link"],
+            "imagen": row["imagen"],
+            "history": history,
+            "last_seen_at": row["last_seen_at"],
+        }
+
+    def query_history(self, query: Optional[str], limit: int) -> Dict:
+        """Productos mas recientes cuyo nombre o tienda contienen `query`.
+
+        Misma semantica de substring que el backend JSON. Si la busqueda tiene
+        varias palabras, todas menos la primera empiezan un token del nombre
+        (y no puede coincidir con la tienda, que no tiene espacios), asi que se
+        filtra primero por el indice de tokens. Una sola palabra cae dentro de
+        un token del nombre o de la tienda: se ubica por rango en
+        `token_suffixes`.
+        """
+        needle = normalize_text(query) if query else ""
+        sql = "SELECT * FROM products"
+        params: List = []
+        if needle:
+            where = ["(instr(search_name, ?) > 0 OR instr(search_store, ?) > 0)"]
+            params = [needle, needle]
+            tokens = needle.split()
+            if len(tokens) == 1:
+                matching = "SELECT token FROM token_suffixes WHERE suffix >= ? AND suffix < ?"
+                where.append(
+                    f"(id IN (SELECT product_id FROM name_tokens WHERE token IN ({matching})) "
+                    f"OR search_store IN ({matching}))"
+                )
+                params += [needle, needle + "\U0010ffff"] * 2
+            else:
+                for token in tokens[1:-1]:
+                    where.append("id IN (SELECT product_id FROM name_tokens WHERE token = ?)")
+                    params.append(token)
+                where.append(
+                    "id IN (SELECT product_id FROM name_tokens WHERE token >= ? AND token < ?)"
+                )
+                params += [tokens[-1], tokens[-1] + "\U0010ffff"]
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY last_seen_at DESC, rowid LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+            history = self._history_for([row["id"] for row in rows])
+            updated_at = self._get_meta("updated_at")
+        return {
+            "updated_at": updated_at,
+            "items": [self._to_item(row, history[row["id"]]) for row in rows],
+        }
+
+    def read(self) -> Dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM products ORDER BY last_seen_at DESC, rowid").fetchall()
+            history = self._history_for([row["id"] for row in rows])
+            updated_at = self._get_meta("updated_at")
+        if not rows and updated_at is None:
+            return {}
+        return {
+            "version": 1,
+            "updated_at": updated_at,
+            "products": {row["id"]: self._to_item(row, history[row["id"]]) for row in rows},
+        }
+
+    def write(self, payload: Dict) -> bool:
+        """Reemplaza todo el historial por el documento JSON `payload`."""
+        products = payload.get("products", {})
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("price_points", "name_tokens", "token_suffixes", "products"):
+                    self._conn.execute(f"DELETE FROM {table}")
+                for key, entry in products.items():
+                    history = entry.get("history", [])
+                    self._insert_product(key, entry)
+                    self._conn.execute(
+                        "UPDATE products SET last_seen_at = ?, last_price = ?, point_count = ? WHERE id = ?",
+                        (
+                            entry.get("last_seen_at"),
+                            history[-1]["precio"] if history else None,
+                            len(history),
+                            key,
+                        ),
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO price_points (product_id, captured_at, precio, query) VALUES (?, ?, ?, ?)",
+                        [
+                            (key, point.get("captured_at", ""), point.get("precio", 0), point.get("query", ""))
+                            for point in history
+                        ],
+                    )
+                self._set_meta("product_count", len(products))
+                self._set_meta("updated_at", payload.get("updated_at"))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+
 class NoOpHistoryBackend(HistoryBackend):
     name = "noop"
 
@@ -135,11 +1131,74 @@ class NoOpHistoryBackend(HistoryBackend):
         return False
 
 
+def env_flag(name: str, default: str = "0") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
 class PriceHistoryService:
-    def __init__(self, backend: HistoryBackend):
+    """Historial de precios sobre un `HistoryBackend`.
+
+    En modo write-behind (`PRICE_HISTORY_WRITE_BEHIND=1`) el documento vive en
+    memoria: `record_snapshot` calcula los cambios y encola el guardado, y un
+    hilo en segundo plano escribe al backend cuando se acumulan
+    `flush_batch` snapshots o pasan `flush_interval` segundos. `close()`
+    hace el ultimo flush. Con `flush_mode="inline"` no hay hilo: el flush
+    vencido lo hace el propio request que graba el snapshot (util en
+    serverless, donde los hilos en segundo plano se congelan). Lo encolado
+    y no guardado (hasta `flush_batch - 1` snapshots) se pierde si la
+    instancia se recicla sin llegar a `close()`.
+
+    En ambos modos el documento parseado se mantiene en memoria y solo se
+    relee si `backend.revision()` cambio (mtime/tamano local, sha/ETag en
+    GitHub), como mucho cada `revalidate_interval` segundos. Las escrituras
+    propias actualizan la revision sin releer.
+    """
+
+    def __init__(
+        self,
+        backend: HistoryBackend,
+        write_behind: Optional[bool] = None,
+        flush_interval: Optional[float] = None,
+        flush_batch: Optional[int] = None,
+        flush_mode: Optional[str] = None,
+        revalidate_interval: Optional[float] = None,
+        alerts=None,
+    ):
         self.backend = backend
+        # Indice de suscripciones (`price_alerts.AlertIndex`) evaluado en cada snapshot.
+        self.alerts = alerts
         self.max_products = int(os.getenv("PRICE_HISTORY_MAX_PRODUCTS", "1000"))
         self.max_points = int(os.getenv("PRICE_HISTORY_MAX_POINTS", "30"))
+        if write_behind is None:
+            write_behind = env_flag("PRICE_HISTORY_WRITE_BEHIND")
+        if flush_interval is None:
+            flush_interval = float(os.getenv("PRICE_HISTORY_FLUSH_SECONDS", "30"))
+        if flush_batch is None:
+            flush_batch = int(os.getenv("PRICE_HISTORY_FLUSH_BATCH", "20"))
+        if flush_mode is None:
+            flush_mode = os.getenv("PRICE_HISTORY_FLUSH_MODE", "thread").strip().lower()
+        # Los backends incrementales ya escriben solo lo que cambia.
+        self.write_behind = write_behind and not backend.incremental
+        self.flush_interval = flush_interval
+        self.flush_batch = max(1, flush_batch)
+        self.flush_inline = flush_mode == "inline"
+        if revalidate_interval is None:
+            revalidate_interval = float(
+                os.getenv("PRICE_HISTORY_REVALIDATE_SECONDS", backend.revalidate_interval)
+            )
+        self.revalidate_interval = revalidate_interval
+
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._view: Optional[Dict] = None
+        self._index: Optional[HistoryIndex] = None
+        self._revision: Optional[Hashable] = None
+        self._checked_at = 0.0
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._wakeup = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._closed = False
 
     @property
     def backend_name(self) -> str:
@@ -153,7 +1212,8 @@ class PriceHistoryService:
         }
 
     def _load(self) -> Dict:
-        data = self.backend.read() or {}
+        with metrics.span("historial_read", backend=self.backend_name):
+            data = self.backend.read() or {}
         if not data:
             return self._base_doc()
         if "products" not in data:
@@ -161,76 +1221,197 @@ class PriceHistoryService:
         return data
 
     def _prune(self, data: Dict) -> None:
-        products = data.get("products", {})
-        if len(products) <= self.max_products:
+        if len(data.get("products", {})) > self.max_products:
+            self._index_for(data).evict(self.max_products)
+
+    def _index_for(self, data: Dict) -> HistoryIndex:
+        products = data.setdefault("products", {})
+        if self._index is None or self._index.products is not products:
+            self._index = HistoryIndex(products)
+        return self._index
+
+    def _apply_snapshot(self, data: Dict, query: str, products: List[Dict], captured_at: str) -> Dict:
+        changes = apply_price_points(data["products"], query, products, captured_at, self.max_points)
+        if self._index is not None and self._index.products is data["products"]:
+            self._index.touch(changes)
+        data["updated_at"] = captured_at
+        self._prune(data)
+        return changes
+
+    def _get_view(self) -> Dict:
+        # Con snapshots encolados la vista es la fuente de verdad.
+        if self._view is not None and self._pending:
+            return self._view
+        now = time.monotonic()
+        if self._view is not None and now - self._checked_at < self.revalidate_interval:
+            return self._view
+        revision = self.backend.revision()
+        self._checked_at = now
+        if self._view is None or revision is None or revision != self._revision:
+            self._view = self._load()
+            self._revision = revision
+        return self._view
+
+    def _mark_written(self) -> None:
+        """La vista coincide con lo guardado: se adopta la nueva revision."""
+        self._revision = self.backend.written_revision()
+        self._checked_at = time.monotonic()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None and not self._closed:
+            self._worker = threading.Thread(
+                target=self._run_worker, name="price-history-flush", daemon=True
+            )
+            self._worker.start()
+
+    def _run_worker(self) -> None:
+        while not self._closed:
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self) -> bool:
+        """Escribe al backend los snapshots encolados (modo write-behind)."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending or self._view is None:
+                    return True
+                payload = copy.deepcopy(self._view)
+                pending = self._pending
+                self._pending = 0
+                self._last_flush = time.monotonic()
+            try:
+                with metrics.span("historial_write", backend=self.backend_name, modo="flush"):
+                    saved = self.backend.write(payload)
+            except Exception as e:
+                print(f"Historial: error en flush: {e}")
+                saved = False
+            with self._lock:
+                if saved:
+                    if self.backend.last_write_merged:
+                        self._adopt_merged(payload)
+                    self._mark_written()
+                else:
+                    self._pending += pending
+            return saved
+
+    def _adopt_merged(self, payload: Dict) -> None:
+        """Toma como vista el documento unido que guardo el backend.
+
+        `payload` ya trae lo de la otra instancia; si durante el flush se
+        grabaron snapshots nuevos, se unen encima para no perderlos.
+        """
+        if self._pending and self._view is not None:
+            self._view = merge_history_docs(payload, self._view, self.max_points, self.max_products)
+        else:
+            self._view = payload
+
+    def close(self) -> None:
+        """Detiene el hilo de flush y guarda lo pendiente."""
+        if self._closed:
             return
-        sorted_items = sorted(
-            products.items(),
-            key=lambda item: item[1].get("last_seen_at", ""),
-            reverse=True,
-        )
-        keep = dict(sorted_items[: self.max_products])
-        data["products"] = keep
+        self._closed = True
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout=self.flush_interval + 5)
+        self.flush()
+        self.backend.close()
 
     def record_snapshot(self, query: str, products: List[Dict]) -> Dict:
-        captured_at = utc_now_iso()
-        data = self._load()
-        product_map = data["products"]
-        changes = {}
+        result = self.record_snapshots([(query, products)])
+        result["changes"] = result["changes"][0]
+        return result
 
-        for product in products:
-            key = product_fingerprint(product)
-            current_price = float(product.get("precio", 0) or 0)
-            if current_price <= 0:
-                continue
+    @staticmethod
+    def _apply_batch(snapshots: List[Tuple[str, List[Dict]]], apply) -> List[Dict]:
+        """Aplica un lote de snapshots y devuelve los cambios de cada uno.
 
-            entry = product_map.setdefault(
-                key,
-                {
-                    "id": key,
-                    "nombre": product.get("nombre", ""),
-                    "tienda": product.get("tienda", ""),
-                    "fuente": product.get("fuente", ""),
-                    "link": product.get("link", ""),
-                    "imagen": product.get("imagen", ""),
-                    "history": [],
-                },
-            )
+        Un producto que aparece en varias queries del lote se registra una
+        sola vez: las siguientes reutilizan su cambio en vez de compararse
+        contra el punto recien agregado.
+        """
+        vistos: Dict[str, Dict] = {}
+        result = []
+        for query, products in snapshots:
+            keys = [product_fingerprint(product) for product in products]
+            nuevos = [product for product, key in zip(products, keys) if key not in vistos]
+            vistos.update(apply(query, nuevos))
+            result.append({key: vistos[key] for key in keys if key in vistos})
+        return result
 
-            prev_price = entry["history"][-1]["precio"] if entry["history"] else None
-            entry["nombre"] = product.get("nombre", entry.get("nombre", ""))
-            entry["tienda"] = product.get("tienda", entry.get("tienda", ""))
-            entry["fuente"] = product.get("fuente", entry.get("fuente", ""))
-            entry["link"] = product.get("link", entry.get("link", ""))
-            entry["imagen"] = product.get("imagen", entry.get("imagen", ""))
-            entry["last_seen_at"] = captured_at
-            entry["history"].append(
-                {
-                    "captured_at": captured_at,
-                    "precio": current_price,
-                    "query": query,
-                }
-            )
-            if len(entry["history"]) > self.max_points:
-                entry["history"] = entry["history"][-self.max_points :]
+    def record_snapshots(self, snapshots: List[Tuple[str, List[Dict]]]) -> Dict:
+        """Graba varios snapshots `(query, productos)` con una sola escritura.
+
+        `changes` trae un dict de cambios por snapshot, en el mismo orden.
+        Con `alerts`, los cambios se evaluan contra las suscripciones.
+        """
+        captured_at = utc_now_iso()
+        result = self._record_snapshots(snapshots, captured_at)
+        if self.alerts is not None:
+            try:
+                result["alerts"] = self.alerts.evaluar(snapshots, result["changes"], captured_at)
+            except Exception as e:
+                print(f"Historial: error evaluando alertas: {e}")
+        return result
 
-            if prev_price is not None:
-                delta = round(current_price - prev_price, 2)
-                pct = round((delta / prev_price) * 100, 2) if prev_price > 0 else 0.0
+    def _record_snapshots(self, snapshots: List[Tuple[str, List[Dict]]], captured_at: str) -> Dict:
+
+        if self.backend.incremental:
+            with metrics.span("historial_write", backend=self.backend_name, modo="incremental"):
+                changes = self._apply_batch(
+                    snapshots,
+                    lambda query, products: self.backend.apply_snapshot(
+                        query, products, captured_at, self.max_points, self.max_products
+                    ),
+                )
+            return {
+                "saved": True,
+                "captured_at": captured_at,
+                "changes": changes,
+                "backend": self.backend_name,
+            }
+
+        if self.write_behind and not self._closed:
+            with self._lock:
+                data = self._get_view()
+                changes = self._apply_batch(
+                    snapshots,
+                    lambda query, products: self._apply_snapshot(data, query, products, captured_at),
+                )
+                self._pending += len(snapshots)
+                flush_now = self._pending >= self.flush_batch
+            saved = False
+            if self.flush_inline:
+                if flush_now or time.monotonic() - self._last_flush >= self.flush_interval:
+                    saved = self.flush()
             else:
-                delta = 0.0
-                pct = 0.0
-
-            changes[key] = {
-                "previous_price": prev_price,
-                "current_price": current_price,
-                "delta": delta,
-                "delta_pct": pct,
+                self._ensure_worker()
+                if flush_now:
+                    self._wakeup.set()
+            return {
+                "saved": saved,
+                "queued": not saved,
+                "captured_at": captured_at,
+                "changes": changes,
+                "backend": self.backend_name,
             }
 
-        data["updated_at"] = captured_at
-        self._prune(data)
-        saved = self.backend.write(data)
+        with self._lock:
+            data = self._get_view()
+            changes = self._apply_batch(
+                snapshots,
+                lambda query, products: self._apply_snapshot(data, query, products, captured_at),
+            )
+            saved = False
+            try:
+                with metrics.span("historial_write", backend=self.backend_name, modo="sync"):
+                    saved = self.backend.write(data)
+            finally:
+                if saved:
+                    self._mark_written()
+                else:
+                    # Lo no guardado no queda en la vista.
+                    self._view = None
 
         return {
             "saved": saved,
@@ -240,20 +1421,25 @@ class PriceHistoryService:
         }
 
     def get_history(self, query: Optional[str] = None, limit: int = 20) -> Dict:
-        data = self._load()
-        products = list(data.get("products", {}).values())
-
-        if query:
-            needle = normalize_text(query)
-            products = [
-                item
-                for item in products
-                if needle in normalize_text(item.get("nombre", ""))
-                or needle in normalize_store(item.get("tienda", ""))
+        if self.backend.incremental:
+            with metrics.span("historial_read", backend=self.backend_name):
+                result = self.backend.query_history(query, max(1, min(limit, 100)))
+            return {
+                "backend": self.backend_name,
+                "updated_at": result["updated_at"],
+                "total": len(result["items"]),
+                "items": result["items"],
+            }
+        with self._lock:
+            result = self._query_history(self._get_view(), query, limit)
+            # Copias para no serializar entradas que otro request esta mutando.
+            result["items"] = [
+                dict(item, history=list(item.get("history", []))) for item in result["items"]
             ]
+        return result
 
-        products.sort(key=lambda x: x.get("last_seen_at", ""), reverse=True)
-        trimmed = products[: max(1, min(limit, 100))]
+    def _query_history(self, data: Dict, query: Optional[str], limit: int) -> Dict:
+        trimmed = self._index_for(data).search(query, max(1, min(limit, 100)))
         return {
             "backend": self.backend_name,
             "updated_at": data.get("updated_at"),
@@ -262,8 +1448,13 @@ class PriceHistoryService:
         }
 
 
-def create_history_service() -> PriceHistoryService:
+def create_history_service(alerts=None) -> PriceHistoryService:
+    return PriceHistoryService(create_history_backend(), alerts=alerts)
+
+
+def create_history_backend() -> HistoryBackend:
     backend_kind = os.getenv("PRICE_HISTORY_BACKEND", "").strip().lower()
+    format_version = int(os.getenv("PRICE_HISTORY_FORMAT", "2"))
 
     if backend_kind == "github":
         token = os.getenv("GITHUB_TOKEN", "")
@@ -271,12 +1462,31 @@ def create_history_service() -> PriceHistoryService:
         path = os.getenv("GITHUB_HISTORY_PATH", "data/price_history.json")
         branch = os.getenv("GITHUB_BRANCH", "main")
         if token and repo:
-            return PriceHistoryService(
-                GithubJsonHistoryBackend(repo=repo, file_path=path, token=token, branch=branch)
+            return GithubJsonHistoryBackend(
+                repo=repo,
+                file_path=path,
+                token=token,
+                branch=branch,
+                max_points=int(os.getenv("PRICE_HISTORY_MAX_POINTS", "30")),
+                max_products=int(os.getenv("PRICE_HISTORY_MAX_PRODUCTS", "1000")),
+                format_version=format_version,
             )
 
+    if backend_kind == "sqlite":
+        file_path = os.getenv("PRICE_HISTORY_SQLITE_FILE", "data/price_history.sqlite3")
+        return SqliteHistoryBackend(file_path=file_path)
+
+    if backend_kind == "local-log":
+        return LocalLogHistoryBackend(
+            directory=os.getenv("PRICE_HISTORY_LOG_DIR", "data/price_history_log"),
+            seed_file=os.getenv("PRICE_HISTORY_FILE", "data/price_history.json"),
+            compact_every=int(os.getenv("PRICE_HISTORY_LOG_COMPACT_EVERY", "200")),
+            max_points=int(os.getenv("PRICE_HISTORY_MAX_POINTS", "30")),
+            max_products=int(os.getenv("PRICE_HISTORY_MAX_PRODUCTS", "1000")),
+        )
+
     if backend_kind in ("local", ""):
         file_path = os.getenv("PRICE_HISTORY_FILE", "data/price_history.json")
-        return PriceHistoryService(LocalJsonHistoryBackend(file_path=file_path))
+        return LocalJsonHistoryBackend(file_path=file_path, format_version=format_version)
 
-    return PriceHistoryService(NoOpHistoryBackend())
+    return NoOpHistoryBackend()
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+CacheKey = Tuple[str, Hashable]
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "stale_until")
+
+    def __init__(self, value: Any, expires_at: float, stale_until: float):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class ResultCache:
+    """Cache en memoria de resultados por (namespace, query normalizada).
+
+    - TTL por namespace (por ejemplo, por fuente) y LRU acotado a `max_entries`.
+    - Stale-while-revalidate: pasado el TTL, durante `stale_ttl` segundos se
+      devuelve el valor viejo y se refresca en segundo plano.
+    - Single-flight: llamadas concurrentes para la misma clave comparten una
+      sola carga.
+    - `negative_ttl`: TTL sugerido para resultados vacios, mas corto para no
+      fijar un fallo transitorio.
+
+    `get_or_load` devuelve `(valor, origen)` con origen `hit`, `stale`,
+    `coalesced`, `miss` o `refresh`.
+    """
+
+    def __init__(
+        self,
+        key_fn: Optional[Callable[[str], Hashable]] = None,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 300.0,
+        negative_ttl: float = 60.0,
+        stale_ttl: float = 1800.0,
+        max_entries: int = 256,
+    ):
+        self.key_fn = key_fn
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.stats = Counter()
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._inflight: Dict[CacheKey, Future] = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def ttl_for(self, namespace: str) -> float:
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def _key(self, namespace: str, query: str) -> CacheKey:
+        return (namespace, self.key_fn(query) if self.key_fn else query)
+
+    def _store(self, key: CacheKey, value: Any, ttl: Optional[float]) -> None:
+        if ttl is None or ttl <= 0 or not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            self._entries[key] = _Entry(value, now + ttl, now + ttl + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def _load(self, key: CacheKey, loader, ttl_fn, future: Future) -> Any:
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        self._store(key, value, ttl_fn(value) if ttl_fn else self.ttl_for(key[0]))
+        with self._lock:
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def _revalidate(self, key: CacheKey, loader, ttl_fn, future: Future) -> None:
+        try:
+            self._load(key, loader, ttl_fn, future)
+        except Exception as e:
+            print(f"ResultCache: error revalidando {key}: {e}")
+
+    def get_or_load(
+        self,
+        namespace: str,
+        query: str,
+        loader: Callable[[], Any],
+        ttl_fn: Optional[Callable[[Any], Optional[float]]] = None,
+        refresh: bool = False,
+    ) -> Tuple[Any, str]:
+        """Devuelve el valor cacheado o lo carga con `loader`.
+
+        `ttl_fn(valor)` decide el TTL de lo cargado; si devuelve None no se
+        cachea (por ejemplo, errores). Con `refresh=True` se ignora lo
+        cacheado pero se sigue coalesciendo y guardando el resultado.
+        """
+        if not self.enabled:
+            self.stats["bypass"] += 1
+            return loader(), "bypass"
+
+        key = self._key(namespace, query)
+        now = time.time()
+        revalidate = None
+
+        with self._lock:
+            entry = None if refresh else self._entries.get(key)
+            if entry is not None and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                if now < entry.expires_at:
+                    self.stats["hit"] += 1
+                    return entry.value, "hit"
+                self.stats["stale"] += 1
+                if key not in self._inflight:
+                    revalidate = self._inflight[key] = Future()
+                stale_value = entry.value
+            else:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+
+        if entry is not None and now < entry.stale_until:
+            if revalidate is not None:
+                self._refresher.submit(self._revalidate, key, loader, ttl_fn, revalidate)
+            return stale_value, "stale"
+
+        if not leader:
+            self.stats["coalesced"] += 1
+            return future.result(), "coalesced"
+
+        self.stats["refresh" if refresh else "miss"] += 1
+        return self._load(key, loader, ttl_fn, future), "refresh" if refresh else "miss"
+
+    def invalidate(self, namespace: str, query: str) -> None:
+        with self._lock:
+            self._entries.pop(self._key(namespace, query), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,51 +1,220 @@
 ﻿import requests
 from bs4 import BeautifulSoup
+import contextvars
+import heapq
+import os
 import time
-from typing import List, Dict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 import re
 import unicodedata
 from urllib.parse import quote_plus
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
 from selenium.common.exceptions import TimeoutException
 
+import html_backends
+import nuxt_payload
+from driver_pool import DriverPool
+from http_session import create_session
+from metrics import metrics
+from result_cache import ResultCache
+
+# Recursos que no aportan datos al scraping y solo encarecen cada carga.
+BLOCKED_URL_PATTERNS = [
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico',
+    '*.woff', '*.woff2', '*.ttf', '*.otf',
+    '*googletagmanager.com*', '*google-analytics.com*', '*doubleclick.net*',
+    '*connect.facebook.net*', '*fbevents*', '*banner*',
+]
+
+PRODUCT_CARD_SELECTOR = "div[class*='product'], article"
+
+# Ofertas por pagina: la busqueda simple se queda con las primeras 20; la
+# profunda pide todas las paginas (la primera incluida) con el tamano real
+# del sitio, `limit=21`, para que los offsets de cada pagina coincidan.
+HARDGAMERS_LIMITE = 20
+HARDGAMERS_LIMITE_PAGINA = 21
+HARDGAMERS_PAGINA_RE = re.compile(r"[?&](?:amp;)?page=(\d+)")
+
+# Espera dentro de la pagina (un solo round trip) a que existan cards con
+# precio. Observa mutaciones del DOM y scrollea para disparar lazy-loading;
+# resuelve con {listo, ms} al detectar productos o al vencer el timeout.
+READY_SCRIPT = """
+const selector = arguments[0];
+const timeoutMs = arguments[1];
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+
+function hayProductos() {
+    const cards = document.querySelectorAll(selector);
+    for (let i = 0; i < cards.length && i < 30; i++) {
+        const text = (cards[i].textContent || '').toLowerCase();
+        if ((text.includes('$') || text.includes('precio')) && text.trim().length > 20) {
+            return true;
+        }
+    }
+    return false;
+}
+
+if (hayProductos()) {
+    done({listo: true, ms: Math.round(performance.now() - start)});
+    return;
+}
+
+let terminado = false;
+let pendiente = false;
+const observer = new MutationObserver(() => {
+    if (pendiente || terminado) return;
+    pendiente = true;
+    setTimeout(() => {
+        pendiente = false;
+        if (hayProductos()) terminar(true);
+    }, 50);
+});
+const scroller = setInterval(() => window.scrollBy(0, 500), 500);
+const timer = setTimeout(() => terminar(hayProductos()), timeoutMs);
+
+function terminar(listo) {
+    if (terminado) return;
+    terminado = true;
+    observer.disconnect();
+    clearInterval(scroller);
+    clearTimeout(timer);
+    done({listo: listo, ms: Math.round(performance.now() - start)});
+}
+
+observer.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+"""
+
+
+class TopOfertas:
+    """Las `k` ofertas unicas mas baratas, con un max-heap acotado.
+
+    Las ofertas se identifican por link (o nombre + tienda); ante empates de
+    precio gana la que llego primero.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self._heap: List[Tuple[float, int, Dict]] = []
+        self._vistas = set()
+        self._orden = 0
+
+    def _clave(self, item: Dict):
+        link = (item.get('link') or '').strip().lower()
+        if link:
+            return link
+        return (item.get('nombre', '').strip().lower(), item.get('tienda', '').strip().lower())
+
+    def agregar(self, items: List[Dict]) -> bool:
+        """Agrega una pagina; devuelve si venia ordenada por precio."""
+        ordenada = True
+        anterior = 0.0
+        for item in items:
+            precio = item['precio']
+            ordenada = ordenada and precio >= anterior
+            anterior = precio
+            clave = self._clave(item)
+            if clave in self._vistas:
+                continue
+            self._orden += 1
+            entrada = (-precio, -self._orden, item)
+            if len(self._heap) < self.k:
+                heapq.heappush(self._heap, entrada)
+            elif entrada > self._heap[0]:
+                heapq.heapreplace(self._heap, entrada)
+            else:
+                continue
+            self._vistas.add(clave)
+        return ordenada
+
+    def no_mejora(self, items: List[Dict]) -> bool:
+        """True si con el heap lleno las paginas posteriores a `items` ya no entran."""
+        if len(self._heap) < self.k or not items:
+            return False
+        return items[-1]['precio'] >= -self._heap[0][0]
+
+    def ordenadas(self) -> List[Dict]:
+        return [item for _, _, item in sorted(self._heap, key=lambda e: (-e[0], -e[1]))]
+
 
 class OfertasScraper:
-    def __init__(self):
+    def __init__(self, session: Optional[requests.Session] = None):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'es-AR,es;q=0.9,en;q=0.8',
         }
-        self.driver = None
+        self.session = session or create_session(headers=self.headers)
+        self.driver_pool = DriverPool(
+            self._crear_driver,
+            size=int(os.getenv('SELENIUM_POOL_SIZE', '2')),
+            max_page_loads=int(os.getenv('SELENIUM_MAX_PAGE_LOADS', '50')),
+            acquire_timeout=float(os.getenv('SELENIUM_ACQUIRE_TIMEOUT', '20')),
+        )
+        self.html_backend = os.getenv('HTML_PARSER_BACKEND', 'lxml').strip().lower()
+        if self.html_backend not in html_backends.HTML_BACKENDS or (
+            self.html_backend == 'lxml' and not html_backends.lxml_available()
+        ):
+            self.html_backend = 'bs4'
+        self.ready_timeout = float(os.getenv('SELENIUM_READY_TIMEOUT', '25'))
+        self.preciosgamer_modo = os.getenv('PRECIOSGAMER_MODO', 'http').strip().lower()
+        self.concurrente = os.getenv('SCRAPER_CONCURRENTE', '1').strip().lower() not in ('0', 'false', 'no')
+        self.timeouts = {
+            'preciosgamer': float(os.getenv('SCRAPER_TIMEOUT_PRECIOSGAMER', '45')),
+            'hardgamers': float(os.getenv('SCRAPER_TIMEOUT_HARDGAMERS', '15')),
+        }
+        # Un hilo por fuente para cada busqueda simultanea esperada; una fuente
+        # vencida sigue ocupando su hilo hasta terminar.
+        self.busquedas_simultaneas = max(1, int(os.getenv('SCRAPER_BUSQUEDAS_SIMULTANEAS', '4')))
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(self._fuentes()) * self.busquedas_simultaneas, thread_name_prefix='fuente'
+        )
+        # Busqueda profunda de HardGamers; pool propio para no bloquear las fuentes.
+        self.hardgamers_paginas = max(1, int(os.getenv('HARDGAMERS_PAGINAS', '1')))
+        self.hardgamers_presupuesto = float(os.getenv('HARDGAMERS_PRESUPUESTO', '8'))
+        self.hardgamers_top_k = max(1, int(os.getenv('HARDGAMERS_TOP_K', '40')))
+        self.hardgamers_paralelo = max(1, int(os.getenv('HARDGAMERS_PARALELO', '3')))
+        self._paginas_executor = ThreadPoolExecutor(
+            max_workers=self.hardgamers_paralelo, thread_name_prefix='hardgamers-pagina'
+        )
+
+    def _crear_driver(self):
+        """Crea un driver de Selenium headless que no descarga recursos pesados"""
+        try:
+            chrome_options = Options()
+            chrome_options.add_argument('--headless')
+            chrome_options.add_argument('--no-sandbox')
+            chrome_options.add_argument('--disable-dev-shm-usage')
+            chrome_options.add_argument('--disable-gpu')
+            chrome_options.add_argument('--window-size=1920,1080')
+            chrome_options.add_argument(f'user-agent={self.headers["User-Agent"]}')
+            # driver.get vuelve en DOMContentLoaded; la espera real la hace READY_SCRIPT.
+            chrome_options.page_load_strategy = 'eager'
+            chrome_options.add_experimental_option('prefs', {
+                'profile.managed_default_content_settings.images': 2,
+            })
+            driver = webdriver.Chrome(options=chrome_options)
+        except Exception as e:
+            print(f"Error al crear driver de Selenium: {e}")
+            print("Intentando sin Selenium...")
+            return None
 
-    def _get_driver(self):
-        """Obtiene o crea un driver de Selenium"""
-        if self.driver is None:
-            try:
-                chrome_options = Options()
-                chrome_options.add_argument('--headless')
-                chrome_options.add_argument('--no-sandbox')
-                chrome_options.add_argument('--disable-dev-shm-usage')
-                chrome_options.add_argument('--disable-gpu')
-                chrome_options.add_argument('--window-size=1920,1080')
-                chrome_options.add_argument(f'user-agent={self.headers["User-Agent"]}')
-                self.driver = webdriver.Chrome(options=chrome_options)
-            except Exception as e:
-                print(f"Error al crear driver de Selenium: {e}")
-                print("Intentando sin Selenium...")
-                return None
-        return self.driver
+        try:
+            driver.execute_cdp_cmd('Network.enable', {})
+            driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': BLOCKED_URL_PATTERNS})
+        except Exception as e:
+            print(f"No se pudo configurar bloqueo de recursos: {e}")
+        return driver
 
-    def _close_driver(self):
-        """Cierra el driver de Selenium"""
-        if self.driver:
-            try:
-                self.driver.quit()
-            except Exception:
-                pass
-            self.driver = None
+    def precalentar_drivers(self, background: bool = True) -> None:
+        """Crea los drivers del pool antes de la primera busqueda"""
+        self.driver_pool.warm_up(background=background)
+
+    def cerrar(self) -> None:
+        """Cierra los drivers de Selenium del pool"""
+        self.driver_pool.close()
 
     def _slugify_query(self, query: str) -> str:
         """Normaliza query a slug ascii estable para URLs de PreciosGamer."""
@@ -167,9 +336,34 @@ class OfertasScraper:
 
         return resultados
 
-    def buscar_preciosgamer(self, query: str) -> List[Dict]:
-        """Busca productos en preciosgamer.com con estrategia robusta de fallbacks."""
+    def _esperar_productos(self, driver, timeout: float) -> Dict:
+        """Espera en la pagina a que aparezcan productos con precio"""
+        with metrics.span('ready_wait', fuente='preciosgamer') as span:
+            try:
+                driver.set_script_timeout(timeout + 5)
+                estado = driver.execute_async_script(
+                    READY_SCRIPT, PRODUCT_CARD_SELECTOR, int(timeout * 1000)
+                )
+                estado = estado or {'listo': False, 'ms': None}
+            except Exception as e:
+                print(f"PreciosGamer: Error esperando productos: {e}")
+                estado = {'listo': False, 'ms': None}
+            span['resultado'] = 'listo' if estado.get('listo') else 'timeout'
+            return estado
+
+    def buscar_preciosgamer(self, query: str, meta: Optional[Dict] = None) -> List[Dict]:
+        """Busca productos en preciosgamer.com con estrategia robusta de fallbacks.
+
+        En modo `http` (default) la pagina se pide con requests y los productos
+        salen del estado Nuxt embebido (o del HTML server-rendered); Selenium
+        queda como ultimo recurso. En modo `selenium` el orden se invierte.
+
+        Si se pasa `meta`, se completa con el metodo usado y, con Selenium, el
+        tiempo hasta que la pagina tuvo productos (`listo_ms`).
+        """
         resultados = []
+        if meta is None:
+            meta = {}
 
         try:
             query_slug = self._slugify_query(query)
@@ -183,51 +377,13 @@ class OfertasScraper:
                 f"?changedate=365&order=asc_price&rate=down&search={query_encoded}"
             )
 
-            driver = self._get_driver()
-            if driver:
-                try:
-                    print(f"PreciosGamer: Accediendo a {url} con Selenium...")
-                    driver.get(url)
-
-                    deadline = time.time() + 25
-                    while time.time() < deadline:
-                        cards = driver.find_elements(By.CSS_SELECTOR, "div[class*='product'], article")
-                        has_price = False
-                        for card in cards[:30]:
-                            text = card.text.lower()
-                            if ('$' in text or 'precio' in text) and len(text) > 20:
-                                has_price = True
-                                break
-                        if has_price:
-                            break
-                        driver.execute_script("window.scrollBy(0, 500);")
-                        time.sleep(0.5)
-
-                    soup = BeautifulSoup(driver.page_source, 'html.parser')
-                    resultados = self._extract_preciosgamer_from_soup(soup, url)
-
-                    if not resultados:
-                        print(f"PreciosGamer: Sin resultados en slug, probando fallback {fallback_url}")
-                        driver.get(fallback_url)
-                        time.sleep(2)
-                        soup = BeautifulSoup(driver.page_source, 'html.parser')
-                        resultados = self._extract_preciosgamer_from_soup(soup, fallback_url)
-                except Exception as e:
-                    print(f"PreciosGamer: Error con Selenium: {e}")
-
-            if not resultados:
-                for candidate in (url, fallback_url):
-                    try:
-                        print(f"PreciosGamer: Fallback requests para {candidate}...")
-                        response = requests.get(candidate, headers=self.headers, timeout=15)
-                        if response.status_code != 200:
-                            continue
-                        soup = BeautifulSoup(response.content, 'html.parser')
-                        resultados = self._extract_preciosgamer_from_soup(soup, candidate)
-                        if resultados:
-                            break
-                    except Exception:
-                        continue
+            pasos = [self._preciosgamer_http, self._preciosgamer_selenium]
+            if self.preciosgamer_modo == 'selenium':
+                pasos.reverse()
+            for paso in pasos:
+                resultados = paso(url, fallback_url, meta)
+                if resultados:
+                    break
         except Exception as e:
             print(f"Error en preciosgamer: {e}")
             import traceback
@@ -236,76 +392,285 @@ class OfertasScraper:
         print(f"PreciosGamer: Retornando {len(resultados)} resultados")
         return resultados
 
-    def buscar_hardgamers(self, query: str) -> List[Dict]:
-        """Busca productos en hardgamers.com.ar"""
+    def _preciosgamer_http(self, url: str, fallback_url: str, meta: Dict) -> List[Dict]:
+        """Una request por URL: estado Nuxt primero, HTML de la respuesta despues."""
+        for candidate in (url, fallback_url):
+            try:
+                print(f"PreciosGamer: Accediendo a {candidate} con requests...")
+                with metrics.span('page_load', fuente='preciosgamer', metodo='requests'):
+                    response = self.session.get(candidate, timeout=15)
+                if response.status_code != 200:
+                    continue
+                with metrics.span('extraccion', fuente='preciosgamer', backend='nuxt'):
+                    resultados = nuxt_payload.extract_preciosgamer(response.content, candidate)
+                if resultados:
+                    meta['metodo'] = 'nuxt'
+                    return resultados
+                metrics.inc('selector_miss', fuente='preciosgamer', backend='nuxt')
+                resultados = self._extraer('preciosgamer', response.content, candidate)
+                if resultados:
+                    meta['metodo'] = 'requests'
+                    return resultados
+            except Exception:
+                continue
+        return []
+
+    def _preciosgamer_selenium(self, url: str, fallback_url: str, meta: Dict) -> List[Dict]:
+        resultados = []
+        with self.driver_pool.lease() as lease:
+            if not lease:
+                return resultados
+            driver = lease.driver
+            try:
+                print(f"PreciosGamer: Accediendo a {url} con Selenium...")
+                inicio = time.time()
+                with metrics.span('page_load', fuente='preciosgamer', metodo='selenium'):
+                    lease.get(url)
+                espera = self._esperar_productos(driver, self.ready_timeout)
+                meta['metodo'] = 'selenium'
+                meta['listo'] = bool(espera.get('listo'))
+                meta['listo_ms'] = round((time.time() - inicio) * 1000)
+
+                resultados = self._extraer('preciosgamer', driver.page_source, url)
+
+                if not resultados:
+                    print(f"PreciosGamer: Sin resultados en slug, probando fallback {fallback_url}")
+                    inicio = time.time()
+                    with metrics.span('page_load', fuente='preciosgamer', metodo='selenium'):
+                        lease.get(fallback_url)
+                    espera = self._esperar_productos(driver, min(10.0, self.ready_timeout))
+                    meta['fallback_url'] = True
+                    meta['listo'] = bool(espera.get('listo'))
+                    meta['listo_ms'] = round((time.time() - inicio) * 1000)
+                    resultados = self._extraer('preciosgamer', driver.page_source, fallback_url)
+            except Exception as e:
+                print(f"PreciosGamer: Error con Selenium: {e}")
+                lease.broken = True
+        return resultados
+
+    def _extract_hardgamers_from_soup(
+        self, soup: BeautifulSoup, page_url: str, limite: int = HARDGAMERS_LIMITE
+    ) -> List[Dict]:
+        """Extrae hasta `limite` resultados de HardGamers desde HTML parseado."""
+        resultados = []
+        productos = soup.find_all('article', class_='product')
+
+        for producto in productos[:limite]:
+            try:
+                nombre_elem = producto.find('h3', class_='product-title', itemprop='name')
+                precio_elem = producto.find('h2', class_='product-price', itemprop='price')
+                img_elem = producto.find('img', itemprop='image')
+                link_elem = producto.find('a')
+
+                if nombre_elem and precio_elem:
+                    nombre = nombre_elem.get_text(strip=True)
+
+                    tienda_elem = producto.find('h4', class_='subtitle')
+                    tienda = tienda_elem.get_text(strip=True) if tienda_elem else ''
+
+                    imagen = ''
+                    if img_elem:
+                        imagen = img_elem.get('src', '')
+                        if imagen and not imagen.startswith('http'):
+                            if imagen.startswith('//'):
+                                imagen = f"https:{imagen}"
+                            elif imagen.startswith('/'):
+                                imagen = f"https://www.hardgamers.com.ar{imagen}"
+                            else:
+                                base_url = page_url.rsplit('/', 1)[0]
+                                imagen = f"{base_url}/{imagen}"
+
+                    precio_content = precio_elem.get('content', '')
+                    precio_texto = precio_elem.get_text(strip=True)
+
+                    if precio_content:
+                        precio = self.limpiar_precio(precio_content)
+                        precio_texto = f"${precio:,.0f}".replace(',', '.')
+                    else:
+                        precio = self.limpiar_precio(precio_texto)
+
+                    link = link_elem.get('href', '') if link_elem else ''
+                    if not link.startswith('http'):
+                        if link.startswith('/'):
+                            link = f"https://www.hardgamers.com.ar{link}"
+                        else:
+                            link = f"https://www.hardgamers.com.ar/{link}"
+
+                    if nombre and precio > 0:
+                        resultados.append({
+                            'nombre': nombre,
+                            'precio': precio,
+                            'precio_texto': precio_texto,
+                            'link': link,
+                            'fuente': 'HardGamers',
+                            'tienda': tienda,
+                            'imagen': imagen,
+                            'descuento': self._extraer_descuento(producto)
+                        })
+            except Exception:
+                continue
+
+        return resultados
+
+    def _extraer(self, fuente: str, markup, url: str, limite: int = HARDGAMERS_LIMITE) -> List[Dict]:
+        """Extrae productos con el backend configurado.
+
+        `limite` acota las ofertas de HardGamers por pagina.
+
+        Con `lxml` se usan selectores precompilados; si fallan o no devuelven
+        nada se reintenta con BeautifulSoup, que es la referencia. El parseo y
+        la extraccion se miden por separado; una pagina sin productos suma a
+        `selector_miss` y cada reintento con bs4 a `parser_fallback`.
+        """
+        if self.html_backend == 'lxml':
+            try:
+                with metrics.span('parse', fuente=fuente, backend='lxml'):
+                    root = html_backends.parse_document(markup)
+                with metrics.span('extraccion', fuente=fuente, backend='lxml'):
+                    if fuente == 'preciosgamer':
+                        resultados = html_backends.extract_preciosgamer(root, url, self.limpiar_precio)
+                    else:
+                        resultados = html_backends.extract_hardgamers(root, url, self.limpiar_precio, limite)
+                if resultados:
+                    return resultados
+                metrics.inc('selector_miss', fuente=fuente, backend='lxml')
+            except Exception as e:
+                print(f"{fuente}: Error con parser lxml, usando bs4: {e}")
+            metrics.inc('parser_fallback', fuente=fuente)
+
+        with metrics.span('parse', fuente=fuente, backend='bs4'):
+            soup = BeautifulSoup(markup, 'html.parser')
+        with metrics.span('extraccion', fuente=fuente, backend='bs4'):
+            if fuente == 'preciosgamer':
+                resultados = self._extract_preciosgamer_from_soup(soup, url)
+            else:
+                resultados = self._extract_hardgamers_from_soup(soup, url, limite)
+        if not resultados:
+            metrics.inc('selector_miss', fuente=fuente, backend='bs4')
+        return resultados
+
+    def buscar_hardgamers(
+        self,
+        query: str,
+        meta: Optional[Dict] = None,
+        paginas: Optional[int] = None,
+        presupuesto: Optional[float] = None,
+        top_k: Optional[int] = None,
+    ) -> List[Dict]:
+        """Busca productos en hardgamers.com.ar
+
+        Con `paginas` > 1 (busqueda profunda) se piden las paginas siguientes
+        en paralelo dentro de `presupuesto` segundos y se devuelven las
+        `top_k` ofertas unicas mas baratas. Como el sitio ordena por precio,
+        se deja de pedir paginas cuando una ya no puede mejorar el k-esimo
+        precio.
+        """
         resultados = []
+        if meta is None:
+            meta = {}
+        meta['metodo'] = 'requests'
+        paginas = self.hardgamers_paginas if paginas is None else max(1, int(paginas))
+        presupuesto = self.hardgamers_presupuesto if presupuesto is None else float(presupuesto)
+        top_k = self.hardgamers_top_k if top_k is None else max(1, int(top_k))
+        inicio = time.time()
         try:
             url = f"https://www.hardgamers.com.ar/search?text={query.replace(' ', '+')}"
-            response = requests.get(url, headers=self.headers, timeout=10)
+            primera_url = url
+            limite = HARDGAMERS_LIMITE
+            if paginas > 1:
+                primera_url = f"{url}&page=1&limit={HARDGAMERS_LIMITE_PAGINA}"
+                limite = HARDGAMERS_LIMITE_PAGINA
+            with metrics.span('page_load', fuente='hardgamers', metodo='requests'):
+                response = self.session.get(primera_url, timeout=10)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.content, 'html.parser')
-                productos = soup.find_all('article', class_='product')
-
-                for producto in productos[:20]:
-                    try:
-                        nombre_elem = producto.find('h3', class_='product-title', itemprop='name')
-                        precio_elem = producto.find('h2', class_='product-price', itemprop='price')
-                        img_elem = producto.find('img', itemprop='image')
-                        link_elem = producto.find('a')
-
-                        if nombre_elem and precio_elem:
-                            nombre = nombre_elem.get_text(strip=True)
-
-                            tienda_elem = producto.find('h4', class_='subtitle')
-                            tienda = tienda_elem.get_text(strip=True) if tienda_elem else ''
-
-                            imagen = ''
-                            if img_elem:
-                                imagen = img_elem.get('src', '')
-                                if imagen and not imagen.startswith('http'):
-                                    if imagen.startswith('//'):
-                                        imagen = f"https:{imagen}"
-                                    elif imagen.startswith('/'):
-                                        imagen = f"https://www.hardgamers.com.ar{imagen}"
-                                    else:
-                                        base_url = response.url.rsplit('/', 1)[0]
-                                        imagen = f"{base_url}/{imagen}"
-
-                            precio_content = precio_elem.get('content', '')
-                            precio_texto = precio_elem.get_text(strip=True)
-
-                            if precio_content:
-                                precio = self.limpiar_precio(precio_content)
-                                precio_texto = f"${precio:,.0f}".replace(',', '.')
-                            else:
-                                precio = self.limpiar_precio(precio_texto)
-
-                            link = link_elem.get('href', '') if link_elem else ''
-                            if not link.startswith('http'):
-                                if link.startswith('/'):
-                                    link = f"https://www.hardgamers.com.ar{link}"
-                                else:
-                                    link = f"https://www.hardgamers.com.ar/{link}"
-
-                            if nombre and precio > 0:
-                                resultados.append({
-                                    'nombre': nombre,
-                                    'precio': precio,
-                                    'precio_texto': precio_texto,
-                                    'link': link,
-                                    'fuente': 'HardGamers',
-                                    'tienda': tienda,
-                                    'imagen': imagen,
-                                    'descuento': self._extraer_descuento(producto)
-                                })
-                    except Exception:
-                        continue
+                resultados = self._extraer('hardgamers', response.content, response.url, limite)
+                if paginas > 1 and resultados:
+                    resultados = self._hardgamers_profundo(
+                        url, response.text, resultados, paginas, inicio + presupuesto, top_k, meta
+                    )
         except Exception as e:
             print(f"Error en hardgamers: {e}")
 
         return resultados
 
+    def _hardgamers_pagina(self, url: str, pagina: int) -> List[Dict]:
+        page_url = f"{url}&page={pagina}&limit={HARDGAMERS_LIMITE_PAGINA}"
+        with metrics.span('page_load', fuente='hardgamers', metodo='requests'):
+            response = self.session.get(page_url, timeout=10)
+        if response.status_code != 200:
+            return []
+        return self._extraer('hardgamers', response.content, response.url, HARDGAMERS_LIMITE_PAGINA)
+
+    def _hardgamers_profundo(
+        self,
+        url: str,
+        html_primera: str,
+        primera: List[Dict],
+        paginas: int,
+        deadline: float,
+        top_k: int,
+        meta: Dict,
+    ) -> List[Dict]:
+        """Pide las paginas 2..N en paralelo y las mezcla con la primera."""
+        numeros = [int(n) for n in HARDGAMERS_PAGINA_RE.findall(html_primera)]
+        ultima = min(paginas, max(numeros, default=paginas))
+        top = TopOfertas(top_k)
+        # Sin orden ascendente dentro de la pagina no se puede cortar antes.
+        ordenado = top.agregar(primera)
+        corte = None
+        if ordenado and top.no_mejora(primera):
+            corte = 1
+
+        pendientes = {}
+        siguientes = iter(range(2, ultima + 1) if corte is None else ())
+        leidas = 1
+        vencido = False
+
+        def lanzar():
+            for pagina in siguientes:
+                if corte is not None and pagina > corte:
+                    return
+                pendientes[self._paginas_executor.submit(
+                    contextvars.copy_context().run, self._hardgamers_pagina, url, pagina
+                )] = pagina
+                if len(pendientes) >= self.hardgamers_paralelo:
+                    return
+
+        lanzar()
+        while pendientes:
+            restante = deadline - time.time()
+            if restante <= 0:
+                vencido = True
+                break
+            hechos, _ = wait(list(pendientes), timeout=restante, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                pagina = pendientes.pop(futuro)
+                try:
+                    items = futuro.result()
+                except Exception as e:
+                    print(f"hardgamers: error en pagina {pagina}: {e}")
+                    continue
+                leidas += 1
+                ordenado = top.agregar(items) and ordenado
+                if ordenado and top.no_mejora(items) and (corte is None or pagina < corte):
+                    corte = pagina
+            if corte is not None:
+                for futuro, pagina in list(pendientes.items()):
+                    if pagina > corte and futuro.cancel():
+                        del pendientes[futuro]
+            lanzar()
+
+        for futuro in pendientes:
+            futuro.cancel()
+        meta['paginas'] = leidas
+        meta['paginas_total'] = ultima
+        meta['corte_temprano'] = corte is not None and corte < ultima
+        if vencido:
+            meta['presupuesto_agotado'] = True
+            metrics.inc('presupuesto_agotado', fuente='hardgamers')
+        return top.ordenadas()
+
     def _extraer_descuento(self, elemento) -> str:
         """Extrae informaciÃ³n de descuento si existe"""
         try:
@@ -327,18 +692,191 @@ class OfertasScraper:
             pass
         return ""
 
-    def buscar_todo(self, query: str) -> Dict:
-        """Busca en ambas paginas y retorna resultados combinados"""
+    def _fuentes(self) -> List[Tuple[str, Callable[..., List[Dict]]]]:
+        return [
+            ('preciosgamer', self.buscar_preciosgamer),
+            ('hardgamers', self.buscar_hardgamers),
+        ]
+
+    def _correr_fuente(
+        self,
+        fuente: str,
+        buscar: Callable[..., List[Dict]],
+        query: str,
+        opciones: Optional[Dict] = None,
+    ) -> Tuple[List[Dict], Dict]:
+        """Ejecuta una fuente capturando errores y arma su estado."""
+        inicio = time.time()
+        meta = {}
+        try:
+            items = buscar(query, meta, **(opciones or {}))
+            estado = {'estado': 'ok', **meta}
+        except Exception as e:
+            print(f"Error en {fuente}: {e}")
+            items = []
+            estado = {'estado': 'error', 'error': str(e)}
+        estado['duracion'] = round(time.time() - inicio, 3)
+        estado['total'] = len(items)
+        metrics.observe('scrape', time.time() - inicio, fuente=fuente, resultado=estado['estado'])
+        return items, estado
+
+    def _ejecutar_fuente(
+        self,
+        fuente: str,
+        buscar: Callable[..., List[Dict]],
+        query: str,
+        cache: Optional[ResultCache] = None,
+        refrescar: bool = False,
+        opciones: Optional[Dict] = None,
+    ) -> Tuple[List[Dict], Dict]:
+        """Ejecuta una fuente pasando por `cache` si se indica.
+
+        Solo se cachean resultados `ok`; los vacios con el TTL negativo. El
+        origen (hit / miss / stale / coalesced / refresh) queda en
+        `estado['cache']`. `opciones` se pasan a la fuente como kwargs y
+        separan su entrada de cache.
+        """
+        if cache is None:
+            return self._correr_fuente(fuente, buscar, query, opciones)
+
+        def ttl(resultado):
+            items, estado = resultado
+            if estado.get('estado') != 'ok':
+                return None
+            return cache.ttl_for(fuente) if items else cache.negative_ttl
+
+        inicio = time.time()
+        espacio = fuente + ''.join(f';{k}={v}' for k, v in sorted((opciones or {}).items()))
+        (items, estado), origen = cache.get_or_load(
+            espacio,
+            query,
+            lambda: self._correr_fuente(fuente, buscar, query, opciones),
+            ttl_fn=ttl,
+            refresh=refrescar,
+        )
+        # Los productos se mutan aguas abajo (price_change) y el valor cacheado
+        # se comparte entre requests: cada llamada trabaja sobre copias.
+        items = [dict(item) for item in items]
+        estado = dict(estado, cache=origen, duracion=round(time.time() - inicio, 3))
+        metrics.inc('busqueda_cache', fuente=fuente, origen=origen)
+        return items, estado
+
+    def buscar_fuente(
+        self,
+        fuente: str,
+        query: str,
+        cache: Optional[ResultCache] = None,
+        refrescar: bool = False,
+        opciones: Optional[Dict] = None,
+    ) -> Tuple[List[Dict], Dict]:
+        """Busca en una sola fuente y devuelve `(items, estado)`."""
+        buscar = dict(self._fuentes())[fuente]
+        return self._ejecutar_fuente(fuente, buscar, query, cache, refrescar, opciones)
+
+    def iterar_fuentes(
+        self,
+        query: str,
+        cache: Optional[ResultCache] = None,
+        opciones: Optional[Dict[str, Dict]] = None,
+    ) -> Iterator[Tuple[str, List[Dict], Dict]]:
+        """Lanza todas las fuentes en paralelo y las entrega a medida que terminan.
+
+        Cada fuente tiene su propio deadline (`self.timeouts`), contado desde
+        que su hilo arranca; si vence se entrega vacia con estado `timeout`.
+        Una fuente que sigue en cola cuando vence su deadline contado desde
+        el encolado tambien se entrega como `timeout` (con `en_cola`) y se
+        cancela. `opciones` va por fuente, por ejemplo
+        `{'hardgamers': {'paginas': 3}}`.
+        """
+        opciones = opciones or {}
+        inicio = time.time()
+        arranques: Dict[str, float] = {}
+
+        def correr(fuente, buscar):
+            arranques[fuente] = time.time()
+            return self._ejecutar_fuente(fuente, buscar, query, cache, False, opciones.get(fuente))
+
+        # Cada hilo corre con una copia del contexto para que sus spans
+        # lleguen al Server-Timing del request que los lanzo.
+        pendientes = {
+            self._executor.submit(contextvars.copy_context().run, correr, fuente, buscar): fuente
+            for fuente, buscar in self._fuentes()
+        }
+
+        def vence(fuente):
+            # En cola el deadline corre desde el encolado; al arrancar, desde el arranque.
+            return arranques.get(fuente, inicio) + self.timeouts.get(fuente, 30)
+
+        while pendientes:
+            proximo_deadline = min(vence(f) for f in pendientes.values())
+            hechos, _ = wait(
+                list(pendientes),
+                timeout=max(0.0, proximo_deadline - time.time()),
+                return_when=FIRST_COMPLETED,
+            )
+            for futuro in hechos:
+                fuente = pendientes.pop(futuro)
+                try:
+                    items, estado = futuro.result()
+                except Exception as e:
+                    print(f"Error en {fuente}: {e}")
+                    items = []
+                    estado = {'estado': 'error', 'error': str(e), 'duracion': round(time.time() - inicio, 3), 'total': 0}
+                yield fuente, items, estado
+
+            ahora = time.time()
+            for futuro, fuente in list(pendientes.items()):
+                deadline = self.timeouts.get(fuente, 30)
+                if ahora >= vence(fuente):
+                    # El hilo sigue corriendo en segundo plano; si termina bien, su
+                    # resultado queda en la cache para la proxima busqueda. Si ni
+                    # arranco, se cancela para no ocupar un hilo de mas.
+                    en_cola = futuro.cancel()
+                    print(f"{fuente}: timeout tras {deadline}s" + (" en cola" if en_cola else ""))
+                    metrics.inc('fuente_timeout', fuente=fuente)
+                    del pendientes[futuro]
+                    estado = {'estado': 'timeout', 'duracion': round(ahora - inicio, 3), 'total': 0}
+                    if en_cola:
+                        estado['en_cola'] = True
+                    yield fuente, [], estado
+
+    def buscar_todo(
+        self,
+        query: str,
+        concurrente: Optional[bool] = None,
+        cache: Optional[ResultCache] = None,
+        opciones: Optional[Dict[str, Dict]] = None,
+    ) -> Dict:
+        """Busca en ambas paginas y retorna resultados combinados.
+
+        En modo concurrente cada fuente corre en su propio hilo con su propio
+        deadline (`self.timeouts`), y el tiempo total es el de la fuente mas
+        lenta. El estado de cada fuente (ok / timeout / error) queda en
+        `resultados['fuentes']`. Con `cache`, cada fuente se resuelve primero
+        contra la cache de resultados. `opciones` son kwargs por fuente.
+        """
+        if concurrente is None:
+            concurrente = self.concurrente
+
         resultados = {
             'query': query,
             'preciosgamer': [],
             'hardgamers': [],
+            'fuentes': {},
             'total': 0
         }
 
-        resultados['preciosgamer'] = self.buscar_preciosgamer(query)
-        time.sleep(1)
-        resultados['hardgamers'] = self.buscar_hardgamers(query)
+        if not concurrente:
+            for fuente, buscar in self._fuentes():
+                items, estado = self._ejecutar_fuente(
+                    fuente, buscar, query, cache, opciones=(opciones or {}).get(fuente)
+                )
+                resultados[fuente] = items
+                resultados['fuentes'][fuente] = estado
+        else:
+            for fuente, items, estado in self.iterar_fuentes(query, cache, opciones):
+                resultados[fuente] = items
+                resultados['fuentes'][fuente] = estado
 
         resultados['total'] = len(resultados['preciosgamer']) + len(resultados['hardgamers'])
         return resultados
@@ -0,0 +1,229 @@
+"""Benchmark offline de extraccion y deduplicacion.
+
+Usa las paginas guardadas en `ej/` (y variantes sinteticas con miles de
+cards) sin red ni navegador. Reporta tiempo por etapa, memoria pico
+asignada e items/seg, y compara contra un baseline guardado.
+
+El baseline no guarda milisegundos absolutos, que solo valen para la maquina
+que lo genero: cada etapa se guarda como cociente contra la etapa
+`referencia` (parsear la pagina de PreciosGamer con el `html.parser` de la
+libreria estandar, codigo que esta serie no toca). La comparacion usa ese
+cociente medido en la maquina actual, asi que el baseline commiteado sirve
+en cualquier equipo; solo hace falta regenerarlo cuando se busca un cambio
+de rendimiento a proposito.
+
+Uso:
+    python scripts/bench_extraction.py                  # compara con baseline
+    python scripts/bench_extraction.py --save-baseline  # actualiza baseline
+    python scripts/bench_extraction.py --check          # exit 1 si hay regresiones
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+os.environ.setdefault('SELENIUM_POOL_WARMUP', '0')
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import html_backends  # noqa: E402
+from app import eliminar_duplicados  # noqa: E402
+from scraper import OfertasScraper  # noqa: E402
+
+PRECIOSGAMER_FIXTURE = ROOT / 'ej' / 'Rtx 5070 ti _ Precios Gamer.html'
+HARDGAMERS_FIXTURE = ROOT / 'ej' / 'Resultados para la búsqueda_ rtx 5070 ti.html'
+PRECIOSGAMER_URL = 'https://preciosgamer.com/rtx_5070_ti'
+HARDGAMERS_URL = 'https://www.hardgamers.com.ar/search?text=rtx+5070+ti'
+BASELINE_FILE = ROOT / 'scripts' / 'bench_baseline.json'
+# Etapa contra la que se normalizan las demas en el baseline.
+REFERENCIA = 'referencia'
+
+
+def escalar_pagina(markup: bytes, selector: str, cards: int) -> bytes:
+    """Arma una pagina sintetica repitiendo las cards del fixture."""
+    soup = BeautifulSoup(markup, 'html.parser')
+    originales = [str(card) for card in soup.select(selector)]
+    if not originales:
+        return markup
+    cuerpo = ''.join(originales[i % len(originales)] for i in range(cards))
+    return f'<html><head><meta charset="utf-8"></head><body>{cuerpo}</body></html>'.encode('utf-8')
+
+
+def productos_sinteticos(base, cantidad: int, seed: int = 1234):
+    """Genera productos con ~50% de duplicados cercanos (mismo nombre y tienda, precio +-0.1%)."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(cantidad):
+        item = dict(base[i % len(base)])
+        lote = i // len(base)
+        item['nombre'] = f"{item['nombre']} lote {lote // 2}"
+        if lote % 2:
+            item['precio'] = round(item['precio'] * (1 + rng.uniform(-0.001, 0.001)), 2)
+        out.append(item)
+    rng.shuffle(out)
+    return out
+
+
+def medir(fn, items: Optional[int], repeat: int):
+    """Corre `fn` `repeat` veces y devuelve tiempos, memoria pico e items/seg.
+
+    Con `items=None` se cuentan los resultados que devuelve `fn`.
+    """
+    resultado = fn()  # warm-up
+    if items is None:
+        items = len(resultado)
+    tiempos = []
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    fn()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mediana = statistics.median(tiempos)
+    return {
+        'median_ms': round(mediana * 1000, 3),
+        'min_ms': round(min(tiempos) * 1000, 3),
+        'peak_kb': round(pico / 1024, 1),
+        'items': items,
+        'items_per_sec': round(items / mediana, 1) if mediana > 0 else None,
+    }
+
+
+def construir_etapas(scraper: OfertasScraper, cards: int, dedup_items: int):
+    pg = PRECIOSGAMER_FIXTURE.read_bytes()
+    hg = HARDGAMERS_FIXTURE.read_bytes()
+    pg_grande = escalar_pagina(pg, "div[class*='product-b']", cards)
+    hg_grande = escalar_pagina(hg, 'article.product', cards)
+
+    pg_items = scraper._extract_preciosgamer_from_soup(BeautifulSoup(pg, 'html.parser'), PRECIOSGAMER_URL)
+    hg_items = scraper._extract_hardgamers_from_soup(BeautifulSoup(hg, 'html.parser'), HARDGAMERS_URL)
+    merged = pg_items + hg_items
+    sinteticos = productos_sinteticos(merged, dedup_items)
+
+    precios = [item['precio_texto'] for item in merged] * 20
+    soup_pg = BeautifulSoup(pg, 'html.parser')
+    cards_pg = soup_pg.find_all('div', class_=lambda x: x and 'product-b' in str(x))
+    cards_pg_lxml = html_backends.PRECIOSGAMER_SELECTORS['productos'](html_backends.parse_document(pg)) \
+        if html_backends.lxml_available() else []
+
+    def referencia():
+        HTMLParser().feed(pg.decode('utf-8', errors='replace'))
+
+    # Las etapas de extraccion cuentan los productos que devuelven: en las
+    # paginas sinteticas los extractores cortan en 40 (PreciosGamer) y 20
+    # (HardGamers), asi que `.x{cards}` mide sobre todo el parseo.
+    etapas = [
+        (REFERENCIA, referencia, 1),
+        ('preciosgamer.bs4', lambda: scraper._extract_preciosgamer_from_soup(
+            BeautifulSoup(pg, 'html.parser'), PRECIOSGAMER_URL), None),
+        ('hardgamers.bs4', lambda: scraper._extract_hardgamers_from_soup(
+            BeautifulSoup(hg, 'html.parser'), HARDGAMERS_URL), None),
+        (f'preciosgamer.bs4.x{cards}', lambda: scraper._extract_preciosgamer_from_soup(
+            BeautifulSoup(pg_grande, 'html.parser'), PRECIOSGAMER_URL), None),
+        (f'hardgamers.bs4.x{cards}', lambda: scraper._extract_hardgamers_from_soup(
+            BeautifulSoup(hg_grande, 'html.parser'), HARDGAMERS_URL), None),
+        ('limpiar_precio', lambda: [scraper.limpiar_precio(p) for p in precios], len(precios)),
+        ('extraer_descuento.bs4', lambda: [scraper._extraer_descuento(c) for c in cards_pg], len(cards_pg)),
+        ('eliminar_duplicados.fixture', lambda: eliminar_duplicados(list(merged)), len(merged)),
+        (f'eliminar_duplicados.x{dedup_items}', lambda: eliminar_duplicados(list(sinteticos)), dedup_items),
+    ]
+
+    if html_backends.lxml_available():
+        etapas += [
+            ('preciosgamer.lxml', lambda: html_backends.extract_preciosgamer(
+                pg, PRECIOSGAMER_URL, scraper.limpiar_precio), None),
+            ('hardgamers.lxml', lambda: html_backends.extract_hardgamers(
+                hg, HARDGAMERS_URL, scraper.limpiar_precio), None),
+            (f'preciosgamer.lxml.x{cards}', lambda: html_backends.extract_preciosgamer(
+                pg_grande, PRECIOSGAMER_URL, scraper.limpiar_precio), None),
+            (f'hardgamers.lxml.x{cards}', lambda: html_backends.extract_hardgamers(
+                hg_grande, HARDGAMERS_URL, scraper.limpiar_precio), None),
+            ('extraer_descuento.lxml', lambda: [
+                html_backends.extraer_descuento(c) for c in cards_pg_lxml], len(cards_pg_lxml)),
+        ]
+    return etapas
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cards', type=int, default=2000, help='cards en las paginas sinteticas')
+    parser.add_argument('--dedup-items', type=int, default=1000, help='productos sinteticos para dedup')
+    parser.add_argument('--only', default='', help='regex para filtrar etapas')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25, help='regresion tolerada (0.25 = 25%%)')
+    parser.add_argument('--check', action='store_true', help='exit 1 si alguna etapa supera el umbral')
+    args = parser.parse_args()
+
+    scraper = OfertasScraper()
+    baseline = {}
+    if args.baseline.exists():
+        guardado = json.loads(args.baseline.read_text(encoding='utf-8'))
+        # Un baseline en milisegundos absolutos (sin referencia) no es comparable.
+        if guardado.get('referencia') == REFERENCIA:
+            baseline = guardado.get('stages', {})
+
+    resultados = {}
+    regresiones = []
+    referencia_ms = None
+    print(f"{'etapa':<34}{'mediana ms':>12}{'min ms':>10}{'pico KB':>10}{'items/s':>12}{'vs base':>10}")
+    for nombre, fn, items in construir_etapas(scraper, args.cards, args.dedup_items):
+        # La referencia se mide siempre (va primera) para poder normalizar.
+        if nombre != REFERENCIA and args.only and not re.search(args.only, nombre):
+            continue
+        stats = medir(fn, items, args.repeat)
+        if nombre == REFERENCIA:
+            referencia_ms = stats['median_ms']
+        stats['relativo'] = round(stats['median_ms'] / referencia_ms, 4) if referencia_ms else None
+        resultados[nombre] = stats
+
+        comparacion = ''
+        previo = baseline.get(nombre)
+        if nombre != REFERENCIA and previo and previo.get('relativo') and stats['relativo']:
+            ratio = stats['relativo'] / previo['relativo'] - 1
+            comparacion = f"{ratio:+.0%}"
+            if ratio > args.threshold:
+                regresiones.append((nombre, ratio))
+                comparacion += ' !'
+        print(
+            f"{nombre:<34}{stats['median_ms']:>12.2f}{stats['min_ms']:>10.2f}"
+            f"{stats['peak_kb']:>10.1f}{stats['items_per_sec'] or 0:>12.0f}{comparacion:>10}"
+        )
+
+    if args.save_baseline:
+        merged = dict(baseline)
+        merged.update(resultados)
+        payload = {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'python': sys.version.split()[0],
+            'referencia': REFERENCIA,
+            'stages': merged,
+        }
+        args.baseline.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f'Baseline guardado en {args.baseline}')
+
+    if regresiones:
+        print('Regresiones:')
+        for nombre, ratio in regresiones:
+            print(f'  {nombre}: {ratio:+.0%}')
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
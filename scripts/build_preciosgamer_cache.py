@@ -1,19 +1,46 @@
-﻿import json
+﻿"""Actualiza data/preciosgamer_cache.json con las queries de data/tracked_queries.json.
+
+Uso:
+    python scripts/build_preciosgamer_cache.py                 # 2 workers, saltea lo fresco
+    python scripts/build_preciosgamer_cache.py --workers 4 --deadline 120
+    python scripts/build_preciosgamer_cache.py --force         # refresca todo
+
+Las queries se procesan en paralelo (un driver de Selenium por worker), de
+la mas prioritaria y vieja a la mas nueva. Cada query terminada se guarda
+en el cache al momento, con escritura atomica, asi que cortar el proceso
+no pierde lo ya hecho. `tracked_queries.json` acepta strings u objetos
+`{"query": "...", "priority": 10}`.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timezone
 from pathlib import Path
 
-from scraper import OfertasScraper
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
 
 TRACKED_QUERIES_FILE = Path('data/tracked_queries.json')
 CACHE_FILE = Path('data/preciosgamer_cache.json')
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
 
 def now_iso():
-    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def parse_iso(value):
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
 
 
 def normalize_query(query: str) -> str:
-    import re
     q = (query or '').lower().strip()
     q = re.sub(r'\s+', ' ', q)
     q = re.sub(r'[^\w\s]', '', q)
@@ -40,61 +67,156 @@ def load_json(path: Path, default):
     if not path.exists():
         return default
     try:
-        return json.loads(path.read_text(encoding='utf-8'))
+        # utf-8-sig: los JSON del repo pueden venir con BOM.
+        return json.loads(path.read_text(encoding='utf-8-sig'))
     except Exception:
         return default
 
 
 def save_json(path: Path, payload):
+    """Escritura atomica: un corte a mitad de camino no deja el archivo roto."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding='utf-8')
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding='utf-8')
+    tmp_path.replace(path)
+
+
+def load_tracked(path: Path):
+    """Devuelve [(query, prioridad)] sin repetidos por query normalizada."""
+    tracked = load_json(path, {'queries': []})
+    raw = tracked.get('queries', []) if isinstance(tracked, dict) else []
+    out = {}
+    for item in raw:
+        if isinstance(item, str):
+            query, priority = item, 0
+        elif isinstance(item, dict):
+            query, priority = item.get('query', ''), item.get('priority', 0)
+        else:
+            continue
+        query = (query or '').strip()
+        if query:
+            out.setdefault(normalize_query(query), (query, int(priority or 0)))
+    return list(out.values())
+
+
+def plan_refresh(tracked, cache_queries, max_age_hours, force=False):
+    """Ordena por prioridad y antiguedad y saltea lo que sigue fresco.
+
+    Una entrada sin resultados nunca cuenta como fresca.
+    """
+    now = datetime.now(timezone.utc)
+    pending = []
+    skipped = []
+    for query, priority in tracked:
+        entry = cache_queries.get(normalize_query(query)) or {}
+        updated_at = parse_iso(entry.get('updated_at'))
+        age_hours = (now - updated_at).total_seconds() / 3600 if updated_at else None
+        fresh = age_hours is not None and age_hours < max_age_hours and entry.get('results')
+        if fresh and not force:
+            skipped.append(query)
+            continue
+        pending.append((-priority, -(age_hours if age_hours is not None else float('inf')), query))
+    pending.sort()
+    return [query for _, _, query in pending], skipped
+
+
+def fetch(scraper, query, inicio):
+    # El deadline corre desde que un worker toma la query, no desde que se encola.
+    inicio.append(time.monotonic())
+    return dedupe_items(scraper.buscar_preciosgamer(query))
+
+
+def commit(cache, query, results):
+    """Aplica el resultado de una query al cache y lo guarda."""
+    key = normalize_query(query)
+    if results:
+        cache['queries'][key] = {
+            'query': query,
+            'updated_at': now_iso(),
+            'results': results,
+        }
+        print(f'  {query} -> {len(results)} resultados guardados')
+    elif cache['queries'].get(key):
+        print(f'  {query} -> 0 resultados, se conserva cache anterior')
+        return
+    else:
+        cache['queries'][key] = {
+            'query': query,
+            'updated_at': now_iso(),
+            'results': [],
+        }
+        print(f'  {query} -> 0 resultados, se crea entrada vacia')
+    cache['generated_at'] = now_iso()
+    save_json(CACHE_FILE, cache)
 
 
 def main():
-    tracked = load_json(TRACKED_QUERIES_FILE, {'queries': []})
-    queries = tracked.get('queries', []) if isinstance(tracked, dict) else []
-    queries = [q.strip() for q in queries if isinstance(q, str) and q.strip()]
-
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=int(os.getenv('PRECIOSGAMER_CACHE_WORKERS', '2')))
+    parser.add_argument('--deadline', type=float, default=float(os.getenv('PRECIOSGAMER_CACHE_DEADLINE', '90')),
+                        help='segundos maximos por query')
+    parser.add_argument('--max-age-hours', type=float,
+                        default=float(os.getenv('PRECIOSGAMER_CACHE_REFRESH_HOURS', '12')),
+                        help='no refrescar queries actualizadas hace menos de esto')
+    parser.add_argument('--force', action='store_true', help='refrescar aunque esten frescas')
+    args = parser.parse_args()
+    workers = max(1, args.workers)
+
+    tracked = load_tracked(TRACKED_QUERIES_FILE)
     existing = load_json(CACHE_FILE, {'generated_at': None, 'queries': {}})
-    existing_queries = existing.get('queries', {}) if isinstance(existing, dict) else {}
-
-    scraper = OfertasScraper()
-    updated = {
-        'generated_at': now_iso(),
-        'queries': dict(existing_queries),
+    cache = {
+        'generated_at': existing.get('generated_at') if isinstance(existing, dict) else None,
+        'queries': dict(existing.get('queries', {})) if isinstance(existing, dict) else {},
     }
 
-    for query in queries:
-        key = normalize_query(query)
-        print(f'Procesando cache para: {query}')
-        try:
-            results = scraper.buscar_preciosgamer(query)
-            results = dedupe_items(results)
-        except Exception as exc:
-            print(f'Error con query "{query}": {exc}')
-            results = []
-
-        if results:
-            updated['queries'][key] = {
-                'query': query,
-                'updated_at': now_iso(),
-                'results': results,
-            }
-            print(f'  -> {len(results)} resultados guardados')
-        else:
-            prev = updated['queries'].get(key)
-            if prev:
-                print('  -> 0 resultados, se conserva cache anterior')
-            else:
-                updated['queries'][key] = {
-                    'query': query,
-                    'updated_at': now_iso(),
-                    'results': [],
-                }
-                print('  -> 0 resultados, se crea entrada vacia')
-
-    save_json(CACHE_FILE, updated)
-    print(f'Cache generado en {CACHE_FILE}')
+    queries, skipped = plan_refresh(tracked, cache['queries'], args.max_age_hours, args.force)
+    for query in skipped:
+        print(f'Fresca, se saltea: {query}')
+    if not queries:
+        print('Nada para refrescar')
+        return
+
+    # Un driver por worker; sin precalentar, se crean a medida que se usan.
+    os.environ.setdefault('SELENIUM_POOL_SIZE', str(workers))
+    from scraper import OfertasScraper
+
+    scraper = OfertasScraper()
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache-worker')
+    cola = list(queries)
+    en_curso = {}
+    timeouts = 0
+    try:
+        while cola or en_curso:
+            while cola and len(en_curso) < workers:
+                query = cola.pop(0)
+                print(f'Procesando cache para: {query}')
+                inicio = []
+                en_curso[executor.submit(fetch, scraper, query, inicio)] = (query, inicio)
+
+            arrancados = [inicio[0] for _, inicio in en_curso.values() if inicio]
+            espera = min(arrancados) + args.deadline - time.monotonic() if arrancados else 1.0
+            hechos, _ = wait(en_curso, timeout=max(0.0, min(espera, 1.0)), return_when=FIRST_COMPLETED)
+            for future in hechos:
+                query, _ = en_curso.pop(future)
+                try:
+                    results = future.result()
+                except Exception as exc:
+                    print(f'Error con query "{query}": {exc}')
+                    results = []
+                commit(cache, query, results)
+
+            ahora = time.monotonic()
+            for future, (query, inicio) in list(en_curso.items()):
+                if inicio and ahora - inicio[0] >= args.deadline:
+                    # El hilo no se puede cortar; su resultado se descarta.
+                    en_curso.pop(future)
+                    timeouts += 1
+                    print(f'Timeout con query "{query}" tras {args.deadline:.0f}s, se conserva cache anterior')
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        scraper.cerrar()
+
+    print(f'Cache actualizado en {CACHE_FILE} ({len(queries)} queries, {timeouts} timeouts)')
 
 
 if __name__ == '__main__':
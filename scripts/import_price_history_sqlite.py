@@ -0,0 +1,46 @@
+"""Importa el historial JSON (`data/price_history.json`) a SQLite.
+
+Uso:
+    python scripts/import_price_history_sqlite.py
+    python scripts/import_price_history_sqlite.py --json otro.json --db data/price_history.sqlite3
+
+Reemplaza el contenido de la base destino. Despues se activa con
+`PRICE_HISTORY_BACKEND=sqlite`.
+"""
+import argparse
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from price_history import LocalJsonHistoryBackend, SqliteHistoryBackend  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--json', type=Path, default=Path(os.getenv('PRICE_HISTORY_FILE', 'data/price_history.json')))
+    parser.add_argument(
+        '--db', type=Path, default=Path(os.getenv('PRICE_HISTORY_SQLITE_FILE', 'data/price_history.sqlite3'))
+    )
+    args = parser.parse_args()
+
+    data = LocalJsonHistoryBackend(str(args.json)).read()
+    if not data:
+        print(f'No hay historial en {args.json}')
+        sys.exit(1)
+
+    backend = SqliteHistoryBackend(str(args.db))
+    try:
+        backend.write(data)
+    finally:
+        backend.close()
+
+    products = data.get('products', {})
+    points = sum(len(entry.get('history', [])) for entry in products.values())
+    print(f'Importados {len(products)} productos y {points} puntos en {args.db}')
+
+
+if __name__ == '__main__':
+    main()
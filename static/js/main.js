@@ -19,6 +19,7 @@
     const retryPreciosgamerBtn = document.getElementById('retryPreciosgamerBtn');
 
     let currentData = null;
+    let busquedaId = 0;
     let currentView = 'grid';
     let priceMin = null;
     let priceMax = null;
@@ -28,6 +29,7 @@
     const ALERT_QUERIES_KEY = 'alertQueries';
     const PRICE_ALERTS_KEY = 'priceAlerts';
     const ALERTS_LAST_CHECK_KEY = 'alertsLastCheck';
+    const ALERTS_ETAG_KEY = 'alertsLastEtag';
 
     // Cargar estado inicial
     cargarHistorial();
@@ -241,15 +243,32 @@
         results.classList.add('hidden');
         error.classList.add('hidden');
 
+        const id = ++busquedaId;
+        if (!window.ReadableStream || !window.TextDecoder) {
+            buscarCompleto(query, id);
+            return;
+        }
+
+        buscarStream(query, id).catch(err => {
+            if (id !== busquedaId) return;
+            loading.classList.add('hidden');
+            mostrarError('Error al buscar. Intenta nuevamente.');
+            console.error(err);
+        });
+    }
+
+    function buscarCompleto(query, id) {
         fetch('/buscar', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify({ query: query })
+            body: JSON.stringify({ query: query, formato: 'compacto' })
         })
             .then(response => response.json())
+            .then(expandirCompacto)
             .then(data => {
+                if (id !== busquedaId) return;
                 loading.classList.add('hidden');
 
                 if (data.error) {
@@ -257,18 +276,128 @@
                     return;
                 }
 
-                currentData = data;
-                mostrarResultados(data, { resetSliders: true });
-                procesarAlertasDeBajada(query, data);
-                actualizarBotonAlerta();
+                finalizarBusqueda(query, data);
             })
             .catch(err => {
+                if (id !== busquedaId) return;
                 loading.classList.add('hidden');
                 mostrarError('Error al buscar. Intenta nuevamente.');
                 console.error(err);
             });
     }
 
+    // Reconstruye las listas de productos de una respuesta `formato: compacto`.
+    function expandirCompacto(data) {
+        if (!data || data.formato !== 'compacto') return data;
+        const campos = data.productos.campos;
+        const productos = data.productos.filas.map(fila => {
+            const producto = {};
+            campos.forEach((campo, i) => {
+                if (fila[i] !== null) producto[campo] = fila[i];
+            });
+            return producto;
+        });
+        const expandido = { ...data };
+        delete expandido.productos;
+        delete expandido.formato;
+        ['todos', 'preciosgamer', 'hardgamers'].forEach(lista => {
+            expandido[lista] = (data[lista] || []).map(i => productos[i]);
+        });
+        return expandido;
+    }
+
+    // Lee /buscar/stream (NDJSON) y muestra cada fuente apenas llega.
+    async function buscarStream(query, id) {
+        const resp = await fetch('/buscar/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ query })
+        });
+
+        if (!resp.ok || !resp.body) {
+            const data = await resp.json();
+            if (id !== busquedaId) return;
+            loading.classList.add('hidden');
+            mostrarError(data.error || 'Error al buscar. Intenta nuevamente.');
+            return;
+        }
+
+        const parcial = {
+            query,
+            preciosgamer: [],
+            hardgamers: [],
+            todos: [],
+            total: 0,
+            fuentes: {
+                preciosgamer: { estado: 'pendiente' },
+                hardgamers: { estado: 'pendiente' }
+            },
+            cache: { preciosgamer_usado: false },
+            renderizado: false
+        };
+
+        const reader = resp.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let corte = buffer.indexOf('\n');
+            while (corte >= 0) {
+                const linea = buffer.slice(0, corte).trim();
+                buffer = buffer.slice(corte + 1);
+                if (linea) procesarEventoBusqueda(JSON.parse(linea), parcial, id);
+                corte = buffer.indexOf('\n');
+            }
+        }
+        if (buffer.trim()) procesarEventoBusqueda(JSON.parse(buffer), parcial, id);
+    }
+
+    function procesarEventoBusqueda(evento, parcial, id) {
+        if (id !== busquedaId) return;
+
+        if (evento.tipo === 'fuente') {
+            parcial[evento.fuente] = evento.items || [];
+            parcial.fuentes[evento.fuente] = evento.estado || {};
+            if (evento.cache_usado) parcial.cache.preciosgamer_usado = true;
+            parcial.todos = [...parcial.preciosgamer, ...parcial.hardgamers]
+                .sort((a, b) => (a.precio || 0) - (b.precio || 0));
+            parcial.total = parcial.todos.length;
+
+            loading.classList.add('hidden');
+            currentData = parcial;
+            mostrarResultados(parcial, { resetSliders: true, activeTab: tabActiva(parcial) });
+            parcial.renderizado = true;
+            return;
+        }
+
+        if (evento.tipo === 'final') {
+            loading.classList.add('hidden');
+            finalizarBusqueda(parcial.query, evento.resultados, tabActiva(parcial));
+            return;
+        }
+
+        if (evento.tipo === 'error') {
+            loading.classList.add('hidden');
+            mostrarError(evento.error || 'Error al buscar. Intenta nuevamente.');
+        }
+    }
+
+    function tabActiva(parcial) {
+        if (!parcial.renderizado) return 'todos';
+        const btn = document.querySelector('.tab-btn.active');
+        return (btn && btn.dataset.tab) || 'todos';
+    }
+
+    function finalizarBusqueda(query, data, activeTab) {
+        currentData = data;
+        mostrarResultados(data, { resetSliders: true, activeTab });
+        procesarAlertasDeBajada(query, data);
+        actualizarBotonAlerta();
+    }
+
     async function reintentarPreciosgamer() {
         const query = searchInput.value.trim() || (currentData && currentData.query) || '';
         if (!query) {
@@ -333,20 +462,31 @@
         error.classList.add('hidden');
 
         let nuevas = 0;
-        for (const item of watched) {
-            try {
-                const resp = await fetch('/buscar', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ query: item.query })
+        try {
+            // Un solo request: el servidor busca todas las queries en paralelo.
+            const headers = { 'Content-Type': 'application/json' };
+            const etag = localStorage.getItem(ALERTS_ETAG_KEY);
+            if (etag) headers['If-None-Match'] = etag;
+            const resp = await fetch('/buscar/lote', {
+                method: 'POST',
+                headers,
+                body: JSON.stringify({ queries: watched.map(item => item.query), limite: 15 })
+            });
+            // 304: mismos resultados que el ultimo chequeo, no hay alertas nuevas.
+            const data = resp.status === 304 ? null : await resp.json();
+            if (data && !data.error) {
+                if (resp.headers.get('ETag')) localStorage.setItem(ALERTS_ETAG_KEY, resp.headers.get('ETag'));
+                (data.resultados || []).forEach(resultado => {
+                    // Las queries que fallaron o vencieron se saltean.
+                    if (resultado.estado !== 'ok') return;
+                    nuevas += procesarAlertasDeBajada(resultado.query, {
+                        todos: resultado.todos,
+                        historial: data.historial
+                    });
                 });
-                const data = await resp.json();
-                if (data && !data.error) {
-                    nuevas += procesarAlertasDeBajada(item.query, data);
-                }
-            } catch (_e) {
-                // Continúa con la siguiente query aunque una falle.
             }
+        } catch (_e) {
+            // Sin respuesta del lote no hay alertas nuevas en este chequeo.
         }
 
         localStorage.setItem(ALERTS_LAST_CHECK_KEY, String(Date.now()));
@@ -388,6 +528,14 @@
         if (data.cache && data.cache.preciosgamer_usado) {
             document.getElementById('statsText').textContent += ' | PreciosGamer desde cache';
         }
+        if (data.fuentes) {
+            const etiquetas = { preciosgamer: 'PreciosGamer', hardgamers: 'HardGamers' };
+            Object.entries(data.fuentes).forEach(([fuente, info]) => {
+                if (info && info.estado && info.estado !== 'ok') {
+                    document.getElementById('statsText').textContent += ` | ${etiquetas[fuente] || fuente}: ${info.estado}`;
+                }
+            });
+        }
 
         const orden = sortSelect.value;
         const preciosgamerFiltrados = ordenarProductos(filtrarProductos(data.preciosgamer || []), orden);